@@ -0,0 +1,150 @@
+"""
+Throughput and latency benchmarks against the local simulator.
+
+    python benchmarks/bench.py [--events 20000] [--commands 2000] [--sizes 10,100,1000,5000] [--latency 0]
+                               [--event-rate 10000] [--record events.nhcrec] [--replay events.nhcrec --speed 10]
+
+The simulator runs on the same event loop as the controller, so the numbers include the cost of both ends and are
+meant to compare changes with each other, not to predict a real controller.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nhc.controller import NHCController
+from nhc.simulator import NHCSimulator
+from nhc.recorder import NHCRecorder, NHCReplayer
+
+
+def percentile(values: list[float], percent: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def bench_events(count: int, **options) -> None:
+    """Events per second through the listener, from the first pushed event until the last one is handled."""
+    async with NHCSimulator(port=0, actions=100) as simulator:
+        controller = NHCController(simulator.host, simulator.port, **options)
+        await controller.connect()
+        sentinel = controller.actions[0].id
+        done = asyncio.Event()
+
+        async def on_sentinel(value: int) -> None:
+            if value == 101:
+                done.set()
+
+        controller.register_callback(sentinel, on_sentinel)
+        await simulator.wait_subscribed()
+        start = time.perf_counter()
+        await simulator.burst(count)
+        simulator.push({"event": "listactions", "data": [{"id": sentinel, "value1": 101}]})
+        await simulator.drain()
+        await done.wait()
+        elapsed = time.perf_counter() - start
+        await controller.disconnect()
+    print(f"events      {count} events in {elapsed:.3f}s, {count / elapsed:,.0f} events/s")
+
+
+async def bench_commands(count: int, latency: float, event_rate: float = 0, **options) -> None:
+    """Round-trip latency of execute, from the call until the controller acknowledged it."""
+    async with NHCSimulator(port=0, actions=100, latency=latency, event_rate=event_rate) as simulator:
+        controller = NHCController(simulator.host, simulator.port, **options)
+        await controller.connect()
+        lights = controller.lights
+        latencies = []
+        for index in range(count):
+            start = time.perf_counter()
+            await controller.execute(lights[index % len(lights)].id, index % 100)
+            latencies.append(time.perf_counter() - start)
+        await controller.disconnect()
+    label = f"commands    {count} sequential"
+    if event_rate:
+        label += f" under {event_rate:,.0f} events/s"
+    if options.get("dual_connection"):
+        label += " (dual connection)"
+    print(
+        f"{label}: mean {statistics.mean(latencies) * 1000:.3f}ms"
+        f" p50 {percentile(latencies, 50) * 1000:.3f}ms"
+        f" p90 {percentile(latencies, 90) * 1000:.3f}ms"
+        f" p99 {percentile(latencies, 99) * 1000:.3f}ms"
+    )
+
+
+async def bench_group(size: int, rounds: int, latency: float, **options) -> None:
+    """Time to turn all lights on and off with group commands, and the socket writes it took."""
+    async with NHCSimulator(port=0, actions=size, latency=latency) as simulator:
+        controller = NHCController(simulator.host, simulator.port, **options)
+        await controller.connect()
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await controller.turn_on_lights()
+            await controller.turn_off_lights()
+        elapsed = time.perf_counter() - start
+        stats = controller.latency["commands"]
+        await controller.disconnect()
+    label = f"group       {rounds * 2} x {len(controller.lights)} lights"
+    if options.get("write_batch") is not None:
+        label += f" (write batch {options['write_batch'] * 1000:g}ms)"
+    print(f"{label} in {elapsed:.3f}s, {stats['commands']} commands in {stats['writes']} writes")
+
+
+async def bench_connect(size: int, latency: float, **options) -> None:
+    """connect() time for a topology of size actions."""
+    async with NHCSimulator(
+        port=0, actions=size, locations=max(1, size // 20), thermostats=max(1, size // 50), energy=max(1, size // 50), latency=latency
+    ) as simulator:
+        controller = NHCController(simulator.host, simulator.port, **options)
+        start = time.perf_counter()
+        await controller.connect()
+        elapsed = time.perf_counter() - start
+        await controller.disconnect()
+    print(f"connect     {size} actions in {elapsed * 1000:.1f}ms")
+
+
+async def bench_replay(path: str, speed: float | None, **options) -> None:
+    """Replay a recording through the parse and dispatch path of a controller without a connection."""
+    controller = NHCController("replay", **options)
+    start = time.perf_counter()
+    count = await NHCReplayer(path).replay(controller, speed)
+    elapsed = time.perf_counter() - start
+    label = "as fast as possible" if speed is None else f"at {speed:g}x"
+    print(f"replay      {count} frames {label} in {elapsed:.3f}s, {count / elapsed:,.0f} frames/s")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--sizes", default="10,100,1000,5000")
+    parser.add_argument("--latency", type=float, default=0, help="seconds the simulator waits before every response")
+    parser.add_argument("--event-rate", type=float, default=10000, help="events per second during the command load test")
+    parser.add_argument("--record", help="record the frames of the event benchmark to this file")
+    parser.add_argument("--replay", help="only replay this recording")
+    parser.add_argument("--speed", type=float, default=None, help="replay speed, as fast as possible when omitted")
+    args = parser.parse_args()
+
+    if args.replay:
+        await bench_replay(args.replay, args.speed)
+        return
+    if args.record:
+        recorder = NHCRecorder(args.record)
+        await bench_events(args.events, recorder=recorder)
+        recorder.close()
+    else:
+        await bench_events(args.events)
+    await bench_commands(args.commands, args.latency)
+    for dual_connection in (False, True):
+        await bench_commands(args.commands, args.latency, args.event_rate, dual_connection=dual_connection)
+    for write_batch in (None, 0.001):
+        await bench_group(1000, 10, args.latency, write_batch=write_batch)
+    for size in args.sizes.split(","):
+        await bench_connect(int(size), args.latency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,16 +1,21 @@
 
 class NHCBaseAction:
     """A Niko Base Action."""
+    __slots__ = ("_name", "_id", "_suggested_area", "_state", "_type", "_controller", "_pending")
     _name: str
     _id: int
-    _suggested_area: str | None = None
-    _state: str | int = None
-    _type: int = None
+    _suggested_area: str | None
+    _state: str | int
+    _type: int
 
     def __init__(self, controller, action):
         """Init Niko Base Action."""
         self._name = action["name"]
         self._controller = controller
+        self._suggested_area = None
+        self._state = None
+        self._type = None
+        self._pending = False
 
         if ("channel" in action):
             self._id = action["channel"]
@@ -64,12 +69,45 @@ class NHCBaseAction:
         """A Niko Action action_id."""
         return self._id
     
-    def update_state(self, state):
-        """Update state."""
-        self._state = round(state * 2.55) if self._type == 2 else state
+    @property
+    def pending(self) -> bool:
+        """An optimistic state waiting for the controller to confirm it."""
+        return self._pending
+
+    @property
+    def event_value(self):
+        """The state in the units of its events, as passed to the callbacks."""
+        return round(self._state / 2.55) if self._type == 2 else self._state
+
+    def update_state(self, state) -> bool:
+        """Update state, returns True when it changed."""
+        state = round(state * 2.55) if self._type == 2 else state
+        if state == self._state:
+            return False
+        self._state = state
+        return True
+
+    def expected_state(self, value):
+        """The event value an executed value is expected to report, None when it cannot be predicted."""
+        return value
+
+    def set_pending(self, expected):
+        """Apply an expected event value ahead of its confirmation, returns the state to roll back to."""
+        previous = self._state
+        self.update_state(expected)
+        self._pending = True
+        return previous
+
+    def confirm(self) -> None:
+        self._pending = False
+
+    def rollback(self, previous) -> None:
+        self._state = previous
+        self._pending = False
 
 class NHCAction(NHCBaseAction):
     """A Niko Action."""
+    __slots__ = ()
 
     @property
     def is_scene(self) -> bool:
@@ -98,6 +136,7 @@ class NHCAction(NHCBaseAction):
 
 class NHCEnergyAction(NHCBaseAction):
     """A Niko Energy Action."""
+    __slots__ = ()
     
     @property
     def is_import(self) -> bool:
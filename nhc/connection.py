@@ -1,4 +1,22 @@
 import asyncio
+import logging
+import re
+import socket
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any
+from .const import DEFAULT_KEEPALIVE
+from .decoder import NHCDecoder
+from .errors import ConnectionError
+from .metrics import NHCMetrics
+from .recorder import NHCRecorder
+
+COMMAND_PATTERN = re.compile(r'"cmd"\s*:\s*"(\w+)"')
+# small request answered by every controller, used to measure the round trip and detect a stalled connection
+PROBE_COMMAND = '{"cmd":"systeminfo"}'
+
+_LOGGER = logging.getLogger(__name__)
 
 class AsyncNetcat:
 
@@ -7,30 +25,42 @@ class AsyncNetcat:
     host: str
     port: int
 
-    def __init__(self, host: str, port: int):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        limit: int = 2 ** 16,
+        read_timeout: float | None = None,
+        write_timeout: float | None = None,
+    ):
         self.host = host
         self.port = port
+        self.limit = limit
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
 
     async def connect(self):
-        """Establishes an asynchronous connection."""
-        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        """Establishes an asynchronous connection, write_timeout also limits the time to connect."""
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, limit=self.limit), self.write_timeout
+        )
 
     async def send(self, data: bytes):
         """Sends data asynchronously."""
         if self.writer:
             self.writer.write(data)
-            await self.writer.drain()
+            await asyncio.wait_for(self.writer.drain(), self.write_timeout)
 
     async def receive(self, num_bytes: int = 1024) -> bytes:
         """Receives data asynchronously."""
         if self.reader:
-            return await self.reader.read(num_bytes)
+            return await asyncio.wait_for(self.reader.read(num_bytes), self.read_timeout)
         return b""
 
     async def receive_line(self) -> str:
         """Receives a single line asynchronously."""
         if self.reader:
-            return await self.reader.readline()
+            return await asyncio.wait_for(self.reader.readline(), self.read_timeout)
         return ""
 
     async def close(self):
@@ -41,9 +71,323 @@ class AsyncNetcat:
 
 class NHCConnection(AsyncNetcat):
     """ A class to communicate with Niko Home Control. """
-    async def send(self, s: str):
-        await super().send(s.encode())
-        return await self.receive_line()
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        limit: int = 2 ** 24,
+        read_timeout: float | None = None,
+        write_timeout: float | None = None,
+        keepalive: tuple[int, int, int] | None = DEFAULT_KEEPALIVE,
+        probe_interval: float | None = None,
+        probe_timeout: float = 5,
+        write_batch: float | None = None,
+        write_batch_size: int = 2 ** 14,
+        nodelay: bool = True,
+    ):
+        # a listactions response is a single line, large installations easily exceed the default 64 KiB
+        super().__init__(host, port, limit, read_timeout, write_timeout)
+        self.keepalive = keepalive
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        # with write_batch, commands written within that many seconds (or until write_batch_size bytes) share one write
+        self.write_batch = write_batch
+        self.write_batch_size = write_batch_size
+        self.nodelay = nodelay
+        self._batch: list[bytes] = []
+        self._batch_size = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._flush_drain: asyncio.Task | None = None
+        self._writes = 0
+        self._commands = 0
+        self._pending: dict[str | None, deque[asyncio.Future]] = {}
+        self._connected = False
+        self._received = 0.0
+        self._watch_handle: asyncio.TimerHandle | None = None
+        self._latencies: deque[float] = deque(maxlen=100)
+        self._probes = 0
+        self._stalls = 0
+        self.metrics: NHCMetrics | None = None
+        self.recorder: NHCRecorder | None = None
+        self.decoder = NHCDecoder()
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    async def connect(self):
+        await super().connect()
+        sock = self.writer.get_extra_info("socket")
+        if sock is not None:
+            if self.keepalive is not None:
+                self._set_keepalive(sock, *self.keepalive)
+            # asyncio enables TCP_NODELAY, without it the kernel also coalesces small writes at the cost of latency
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self.nodelay else 0)
+        self._connected = True
+        self._received = time.monotonic()
+        if self.read_timeout is not None or self.probe_interval is not None:
+            self._schedule_watch()
+
+    @staticmethod
+    def _set_keepalive(sock: socket.socket, idle: int, interval: int, count: int) -> None:
+        """Let the kernel notice a dead peer after idle + interval * count seconds, where the platform allows it."""
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        elif hasattr(socket, "TCP_KEEPALIVE"):
+            # macOS names the idle time TCP_KEEPALIVE
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+        if hasattr(socket, "TCP_KEEPINTVL"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+        if hasattr(socket, "TCP_KEEPCNT"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+
+    async def probe(self) -> float:
+        """Send the probe command and return its round trip time in seconds, requires listen to be running."""
+        start = time.perf_counter()
+        await asyncio.wait_for(self.send(PROBE_COMMAND), self.probe_timeout)
+        latency = time.perf_counter() - start
+        self._latencies.append(latency)
+        self._probes += 1
+        return latency
+
+    def _watch(self) -> None:
+        """
+        Check for silence and send a probe, a stalled connection is aborted so listen ends and the controller
+        reconnects. Runs on timers instead of a task, many connections on one loop cost no tasks while idle.
+        """
+        self._watch_handle = None
+        if not self._connected:
+            return
+        if self.read_timeout is not None and time.monotonic() - self._received > self.read_timeout:
+            self._abort()
+            return
+        if self.probe_interval is None:
+            self._schedule_watch()
+            return
+        started = time.perf_counter()
+        future = self.request(PROBE_COMMAND)
+        timeout = asyncio.get_running_loop().call_later(self.probe_timeout, self._probe_timeout, future)
+        future.add_done_callback(lambda future: self._probed(future, started, timeout))
+
+    def _probed(self, future: asyncio.Future, started: float, timeout: asyncio.TimerHandle) -> None:
+        timeout.cancel()
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._latencies.append(time.perf_counter() - started)
+        self._probes += 1
+        self._schedule_watch()
+
+    def _probe_timeout(self, future: asyncio.Future) -> None:
+        if not future.done():
+            future.cancel()
+            self._abort()
+
+    def _schedule_watch(self) -> None:
+        intervals = [self.probe_interval]
+        if self.read_timeout is not None:
+            intervals.append(self.read_timeout / 2)
+        interval = min(value for value in intervals if value is not None)
+        self._watch_handle = asyncio.get_running_loop().call_later(interval, self._watch)
+
+    def _abort(self) -> None:
+        """Drop a stalled connection without waiting for the peer."""
+        self._stalls += 1
+        self._connected = False
+        self.writer.transport.abort()
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Round trip times of the recent probes in seconds, stalls counts the connections declared dead, commands and
+        writes the commands sent and the socket writes they took.
+        """
+        latencies = self._latencies
+        return {
+            "latency": latencies[-1] if latencies else None,
+            "latency_min": min(latencies) if latencies else None,
+            "latency_avg": sum(latencies) / len(latencies) if latencies else None,
+            "latency_max": max(latencies) if latencies else None,
+            "probes": self._probes,
+            "stalls": self._stalls,
+            "commands": self._commands,
+            "writes": self._writes,
+            "idle": time.monotonic() - self._received if self._connected else None,
+        }
+
+    def request(self, s: str) -> asyncio.Future:
+        """Write a command without draining, returns a future for its response."""
+        if not self._connected:
+            raise ConnectionError("not connected")
+        match = COMMAND_PATTERN.search(s)
+        cmd = match and match.group(1)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(cmd, deque()).append(future)
+        self._write(s.encode())
+        if self.metrics is not None:
+            start = time.perf_counter()
+            metrics = self.metrics
+            future.add_done_callback(lambda _: metrics.record_command(cmd, time.perf_counter() - start))
+        return future
+
+    async def send(self, s: str) -> dict[str, Any]:
+        """Send a command and wait for its response, requires listen to be running."""
+        future = self.request(s)
+        await self.drain()
+        return await future
+
+    def _write(self, data: bytes) -> None:
+        """Write now, or add to the batch which is written when it is full or its window ends."""
+        self._commands += 1
+        if self.write_batch is None:
+            self._writes += 1
+            self.writer.write(data)
+            return
+        self._batch.append(data)
+        self._batch_size += len(data)
+        if self._batch_size >= self.write_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.write_batch, self._flush)
+
+    def _flush(self) -> None:
+        """Write the batch as one buffer, commands are not delimited so they are joined as they would be on the wire."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._batch:
+            return
+        data = b"".join(self._batch)
+        self._batch.clear()
+        self._batch_size = 0
+        if self._connected:
+            self._writes += 1
+            self.writer.write(data)
+            transport = self.writer.transport
+            if self._flush_drain is None and transport.get_write_buffer_size() > transport.get_write_buffer_limits()[1]:
+                # nobody may write after this batch, drain it here so the write timeout still applies
+                self._flush_drain = asyncio.create_task(self.drain())
+                self._flush_drain.add_done_callback(self._flush_drained)
+
+    def _flush_drained(self, task: asyncio.Task) -> None:
+        self._flush_drain = None
+        if not task.cancelled():
+            # a timeout already dropped the connection, the listener reconnects
+            task.exception()
+
+    async def drain(self):
+        """
+        Wait until the written commands are flushed, a write that does not complete in time drops the connection.
+        A pending batch is not waited for, that would serialise the job queue, but the batches written before it are:
+        while they fill the socket buffer this pushes back like an unbatched write.
+        """
+        if self.write_timeout is None:
+            await self.writer.drain()
+            return
+        try:
+            await asyncio.wait_for(self.writer.drain(), self.write_timeout)
+        except asyncio.TimeoutError:
+            self._abort()
+            raise ConnectionError("write timeout") from None
     
     async def write(self, s: str):
-        await super().send(s.encode())
+        if not self._connected:
+            raise ConnectionError("not connected")
+        self._write(s.encode())
+        await self.drain()
+
+    async def listen(
+        self,
+        on_event: Callable[[dict[str, Any]], Awaitable[None]],
+        wants_event: Callable[[str], bool] | None = None,
+    ) -> None:
+        """
+        Read all incoming lines, responses resolve the matching request and events are passed to on_event.
+        The event type is read before decoding, events rejected by wants_event are skipped without decoding them.
+        """
+        try:
+            async for line in self.reader:
+                self._received = time.monotonic()
+                if self.recorder is not None:
+                    self.recorder.record(line)
+                await self.feed(line, on_event, wants_event)
+        finally:
+            self._connected = False
+            self._fail_pending(ConnectionError("connection closed"))
+
+    async def feed(
+        self,
+        line: bytes,
+        on_event: Callable[[dict[str, Any]], Awaitable[None]],
+        wants_event: Callable[[str], bool] | None = None,
+    ) -> None:
+        """Handle one received line, as listen does. A line that is not valid json is skipped."""
+        if not line.strip():
+            return
+        decoder = self.decoder
+        event = decoder.event_type(line)
+        if event is not None:
+            if self.metrics is not None:
+                self.metrics.record_event(event)
+            if wants_event is not None and not wants_event(event):
+                return
+        try:
+            if self.metrics is None:
+                message = decoder.loads(line)
+            else:
+                start = time.perf_counter()
+                message = decoder.loads(line)
+                self.metrics.record_parse(time.perf_counter() - start)
+        except ValueError:
+            _LOGGER.warning("Skipped malformed line from %s:%s: %r", self.host, self.port, line[:200])
+            if event is None:
+                self._fail_response(line)
+            return
+        if event is not None:
+            await on_event(message)
+        else:
+            self._resolve(message)
+
+    def _resolve(self, message: dict[str, Any]) -> None:
+        """Resolve the oldest request waiting for this command, responses without one are dropped."""
+        futures = self._pending.get(message.get("cmd"))
+        while futures:
+            future = futures.popleft()
+            if not future.done():
+                future.set_result(message)
+                break
+        if futures is not None and not futures:
+            del self._pending[message.get("cmd")]
+
+    def _fail_response(self, line: bytes) -> None:
+        """Fail the request a malformed response was for, when its command can still be read."""
+        match = COMMAND_PATTERN.search(line.decode(errors="replace"))
+        futures = self._pending.get(match and match.group(1))
+        if futures:
+            future = futures.popleft()
+            if not future.done():
+                future.set_exception(ValueError("malformed response"))
+            if not futures:
+                del self._pending[match.group(1)]
+
+    def _fail_pending(self, error: Exception) -> None:
+        """Fail all requests still waiting for a response."""
+        for futures in self._pending.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+        self._pending.clear()
+
+    async def close(self):
+        self._connected = False
+        if self._watch_handle is not None:
+            self._watch_handle.cancel()
+            self._watch_handle = None
+        self._flush()
+        if self._flush_drain is not None:
+            self._flush_drain.cancel()
+        self._fail_pending(ConnectionError("connection closed"))
+        try:
+            await super().close()
+        except OSError:
+            pass
@@ -31,4 +31,16 @@ ENERGY_TYPES = {
 ALARM_TYPES = {
     0: "alarm",
     1: "notice"
-}
\ No newline at end of file
+}
+
+# keepalive idle, interval and count in seconds, a silent peer is dropped after 25 seconds
+DEFAULT_KEEPALIVE = (10, 5, 3)
+
+JOB_OVERFLOW_BLOCK = "block"
+JOB_OVERFLOW_DROP_OLDEST = "drop_oldest"
+JOB_OVERFLOW_REJECT = "reject"
+
+EVENT_POLICY_DROP_OLDEST = "drop_oldest"
+EVENT_POLICY_DROP_NEWEST = "drop_newest"
+EVENT_POLICY_COALESCE = "coalesce"
+EVENT_POLICY_BLOCK = "block"
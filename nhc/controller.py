@@ -1,6 +1,18 @@
-from nhc.const import DEFAULT_PORT
+from nhc.const import DEFAULT_PORT, DEFAULT_KEEPALIVE, JOB_OVERFLOW_BLOCK, EVENT_POLICY_DROP_OLDEST, EVENT_POLICY_BLOCK, COVER_OPEN, COVER_CLOSE, COVER_STOP
 from .errors import UnknownError, ToManyRequestsOrSyntaxError
 from .connection import NHCConnection
+from .jobs import NHCJobQueue
+from .ratelimit import NHCRateLimiter
+from .dispatch import NHCDispatcher, NHCSubscriber, callback_name
+from .metrics import NHCMetrics
+from .decoder import NHCDecoder
+from .timeseries import NHCEnergyBuffer, aggregate_energy
+from .subscription import NHCEventSubscription
+from .routing import NHCRoute, NHCRoutingTable
+from .snapshot import NHCSnapshot
+from .optimistic import NHCOptimistic
+from .recorder import NHCRecorder
+from .history import NHCHistory
 from .scene import NHCScene
 from .light import NHCLight
 from .cover import NHCCover
@@ -8,27 +20,120 @@ from .fan import NHCFan
 from .energy import NHCEnergy
 from .thermostat import NHCThermostat
 from .events import NHCActionEvent, NHCEnergyEvent, NHCThermostatEvent, NHCAlarmEvent
-import json
 import asyncio
-from collections.abc import Awaitable, Callable
+import itertools
+import logging
+from collections.abc import Awaitable, Callable, Hashable, Iterable, Mapping
 from typing import Any
 
+# listlocations goes first, actions and thermostats need the locations for their suggested area
+DISCOVERY_COMMANDS = ("listlocations", "listthermostat", "listenergy", "systeminfo", "listactions")
+
+_LOGGER = logging.getLogger(__name__)
+
 class NHCController:
-    _actions: list[NHCLight | NHCCover | NHCFan] = []
-    _locations: dict[int, str] = {}
-    _energy: dict[str, NHCEnergy] = {}
-    _thermostats: dict[str, NHCThermostat] = {}
-    _system_info: dict[str, Any] = {}
-    _callbacks: dict[str, list[Callable[[int], Awaitable[None]]]] = {}
-    _alarm_callbacks: list[Callable[[int], Awaitable[None]]] = []
-    jobs = []
-    jobRunning = False
+    _actions: list[NHCLight | NHCCover | NHCFan]
+    _locations: dict[int, str]
+    _energy: dict[str, NHCEnergy]
+    _thermostats: dict[str, NHCThermostat]
+    _system_info: dict[str, Any]
+    _alarm_callbacks: list[NHCSubscriber]
+    _batch_callbacks: list[NHCSubscriber]
     
-    def __init__(self, host, port=DEFAULT_PORT) -> None:
+    def __init__(
+        self,
+        host,
+        port=DEFAULT_PORT,
+        max_jobs: int = 0,
+        job_overflow: str = JOB_OVERFLOW_BLOCK,
+        coalesce: bool = False,
+        debounce: float = 0,
+        rate_limiter: NHCRateLimiter | None = None,
+        snapshot: NHCSnapshot | None = None,
+        reconnect: bool = True,
+        reconnect_delay: float = 1,
+        max_reconnect_delay: float = 60,
+        dispatcher: NHCDispatcher | None = None,
+        metrics: NHCMetrics | None = None,
+        decoder: NHCDecoder | None = None,
+        energy_history: int = 0,
+        dual_connection: bool = False,
+        read_timeout: float | None = None,
+        write_timeout: float | None = 10,
+        keepalive: tuple[int, int, int] | None = DEFAULT_KEEPALIVE,
+        probe_interval: float | None = 30,
+        probe_timeout: float = 5,
+        write_batch: float | None = None,
+        write_batch_size: int = 2 ** 14,
+        nodelay: bool = True,
+        optimistic: NHCOptimistic | None = None,
+        recorder: NHCRecorder | None = None,
+        history: NHCHistory | None = None,
+    ) -> None:
         self._host: str = host
         self._port: int = port
-        self._connection = NHCConnection(host, port)
-        
+        # all state is per instance, several controllers can share a process (see NHCHub)
+        self._actions = []
+        self._locations = {}
+        self._energy = {}
+        self._thermostats = {}
+        self._system_info = {}
+        self._router = NHCRoutingTable(self._routing_entities)
+        self._alarm_callbacks = []
+        self._batch_callbacks = []
+        # set by NHCHub, called with the controller and the changes of every frame
+        self.on_changes: Callable[["NHCController", dict[str | int, Any]], None] | None = None
+        options = {
+            "read_timeout": read_timeout,
+            "write_timeout": write_timeout,
+            "keepalive": keepalive,
+            "probe_interval": probe_interval,
+            "probe_timeout": probe_timeout,
+            "write_batch": write_batch,
+            "write_batch_size": write_batch_size,
+            "nodelay": nodelay,
+        }
+        self._connection = NHCConnection(host, port, **options)
+        # with dual_connection events get a socket of their own, commands and events no longer wait for each other
+        self._event_connection = NHCConnection(host, port, **options) if dual_connection else self._connection
+        self._jobs = NHCJobQueue(max_jobs, job_overflow, coalesce, debounce)
+        self._acknowledgements: dict[asyncio.Future, asyncio.Future] = {}
+        self._sequence = itertools.count()
+        self._latest: dict[Hashable, int] = {}
+        self._rate_limiter = rate_limiter
+        self._snapshot = snapshot
+        self._discovery: dict[str, Any] = {}
+        self._reconcile_task: asyncio.Task | None = None
+        self._listen_tasks: list[asyncio.Task] = []
+        self._reconnect = reconnect
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._closing = False
+        self._dispatcher = dispatcher if dispatcher is not None else NHCDispatcher()
+        self._metrics = metrics
+        self._energy_history = energy_history
+        self._subscriptions: list[NHCEventSubscription] = []
+        self._optimistic = optimistic
+        if optimistic is not None:
+            optimistic.on_change = self._dispatch_state
+        self._recorder = recorder
+        self._history = history
+        for connection in self._connections:
+            connection.metrics = metrics
+            connection.recorder = recorder
+            if decoder is not None:
+                connection.decoder = decoder
+        self._jobs.metrics = metrics
+        self._dispatcher.metrics = metrics
+        self._actions_by_id: dict[int, NHCScene | NHCLight | NHCCover | NHCFan] = {}
+        self._actions_by_type: dict[str, list[NHCScene | NHCLight | NHCCover | NHCFan]] = {
+            "scenes": [],
+            "lights": [],
+            "covers": [],
+            "fans": [],
+        }
+        self._actions_by_location: dict[str | None, list[NHCScene | NHCLight | NHCCover | NHCFan]] = {}
+
     @property
     def host(self) -> str:
         return self._host
@@ -51,35 +156,19 @@ class NHCController:
 
     @property
     def scenes(self) -> list[NHCScene]:
-        scenes: list[NHCScene] = []
-        for action in self._actions:
-            if action.is_scene is True:
-                scenes.append(action)
-        return scenes
+        return self._actions_by_type["scenes"]
     
     @property
     def lights(self) -> list[NHCLight]:
-        lights: list[NHCLight] = []
-        for action in self._actions:
-            if action.is_light is True or action.is_dimmable is True:
-                lights.append(action)
-        return lights
+        return self._actions_by_type["lights"]
     
     @property
     def covers(self) -> list[NHCCover]:
-        covers: list[NHCCover] = []
-        for action in self._actions:
-            if action.is_cover is True:
-                covers.append(action)
-        return covers
+        return self._actions_by_type["covers"]
     
     @property
     def fans(self) -> list[NHCFan]:
-        fans: list[NHCFan] = []
-        for action in self._actions:
-            if action.is_fan is True:
-                fans.append(action)
-        return fans
+        return self._actions_by_type["fans"]
     
     @property
     def thermostats(self) -> dict[str, Any]:
@@ -89,39 +178,335 @@ class NHCController:
     def energy(self) -> dict[str, Any]:
         return self._energy
 
-    async def connect(self) -> None:
-        await self._connection.connect()
+    def energy_summary(self, window: float | None = None) -> dict[str, dict[str, float]]:
+        """Mean power and energy per energy type over the last window seconds, requires energy_history."""
+        return aggregate_energy(self._energy.values(), window)
+
+    def get_action(self, action_id: int) -> NHCScene | NHCLight | NHCCover | NHCFan | None:
+        """Get an action by its id."""
+        return self._actions_by_id.get(action_id)
+
+    def get_actions_by_location(self, location: str | None) -> list[NHCScene | NHCLight | NHCCover | NHCFan]:
+        """Get all actions in a location (suggested area)."""
+        return self._actions_by_location.get(location, [])
+
+    def _action_bucket(self, action: NHCScene | NHCLight | NHCCover | NHCFan) -> str | None:
+        """The typed view an action belongs to."""
+        if action.is_scene:
+            return "scenes"
+        if action.is_light or action.is_dimmable:
+            return "lights"
+        if action.is_cover:
+            return "covers"
+        if action.is_fan:
+            return "fans"
+        return None
 
-        for location in await self._send('{"cmd": "listlocations"}'):
+    def _add_action(self, action: NHCScene | NHCLight | NHCCover | NHCFan) -> None:
+        """Add an action to the actions list and its indexes."""
+        existing = self._actions_by_id.get(action.id)
+        if existing is not None:
+            self._remove_action(existing)
+        self._actions.append(action)
+        self._actions_by_id[action.id] = action
+        bucket = self._action_bucket(action)
+        if bucket is not None:
+            self._actions_by_type[bucket].append(action)
+        self._actions_by_location.setdefault(action.suggested_area, []).append(action)
+
+    def _remove_action(self, action: NHCScene | NHCLight | NHCCover | NHCFan) -> None:
+        """Remove an action from the actions list and its indexes."""
+        self._actions.remove(action)
+        del self._actions_by_id[action.id]
+        bucket = self._action_bucket(action)
+        if bucket is not None:
+            self._actions_by_type[bucket].remove(action)
+        location = self._actions_by_location[action.suggested_area]
+        location.remove(action)
+        if not location:
+            del self._actions_by_location[action.suggested_area]
+
+    def _create_action(self, action: dict[str, Any]) -> NHCScene | NHCLight | NHCCover | NHCFan | None:
+        if (action["type"] == 0):
+            return NHCScene(self, action)
+        elif (action["type"] == 1 or action["type"] == 2):
+            return NHCLight(self, action)
+        elif (action["type"] == 3):
+            return NHCFan(self, action)
+        elif (action["type"] == 4):
+            return NHCCover(self, action)
+        return None
+
+    def _sync_locations(self, locations: list[dict[str, Any]]) -> None:
+        self._locations.clear()
+        for location in locations:
             self._locations[location["id"]] = location["name"]
 
-        for thermostat in await self._send('{"cmd": "listthermostat"}'):
+    async def _sync_actions(self, actions: list[dict[str, Any]], changes: dict[str | int, Any]) -> None:
+        """Apply a listactions payload, only actions whose state changed are dispatched."""
+        seen = set()
+        for (_action) in actions:
+            entity = self._create_action(_action)
+            if (entity is None):
+                continue
+            seen.add(entity.id)
+            existing = self._actions_by_id.get(entity.id)
+            if (
+                existing is None
+                or existing.name != entity.name
+                or existing.type != entity.type
+                or existing.suggested_area != entity.suggested_area
+            ):
+                self._add_action(entity)
+                changed = existing is not None and existing.state != entity.state
+            else:
+                changed = existing.update_state(_action["value1"])
+            if changed:
+                changes[entity.id] = _action["value1"]
+                await self.async_dispatch_update(entity.id, _action["value1"])
+
+        for action in [action for action in self._actions_by_id.values() if action.id not in seen]:
+            self._remove_action(action)
+
+    async def _sync_thermostats(self, thermostats: list[dict[str, Any]], changes: dict[str | int, Any]) -> None:
+        """Apply a listthermostat payload, only thermostats whose state changed are dispatched."""
+        seen = set()
+        for thermostat in thermostats:
             entity =  NHCThermostat(self, thermostat)
-            self._thermostats[entity.action_id] = entity
-
-        for energy in await self._send('{"cmd": "listenergy"}'):
-            entity = NHCEnergy(self, energy)
-            self._energy[entity.action_id] = entity
-
-        self._system_info = await self._send('{"cmd": "systeminfo"}')
-
-        for (_action) in await self._send('{"cmd": "listactions"}'):
-            entity = None
-            if (_action["type"] == 0):
-                entity = NHCScene(self, _action)
-            elif (_action["type"] == 1 or _action["type"] == 2):
-                entity = NHCLight(self, _action)
-            elif (_action["type"] == 3):
-                entity = NHCFan(self, _action)
-            elif (_action["type"] == 4):
-                entity = NHCCover(self, _action)
-            if (entity is not None):
-                self._actions.append(entity)
-        
-        self._listen_task = asyncio.create_task(self._listen())
-        
-    async def _send(self, data) -> dict[str, Any] | None:
-        response = json.loads(await self._connection.send(data))
+            seen.add(entity.action_id)
+            existing = self._thermostats.get(entity.action_id)
+            if existing is None or existing.name != entity.name or existing.suggested_area != entity.suggested_area:
+                self._thermostats[entity.action_id] = entity
+                changed = existing is not None
+            else:
+                changed = existing.update_state(thermostat)
+            if changed:
+                changes[entity.id] = thermostat
+                await self.async_dispatch_update(entity.id, thermostat)
+
+        for action_id in [action_id for action_id in self._thermostats if action_id not in seen]:
+            del self._thermostats[action_id]
+
+    async def _sync_energy(self, energy: list[dict[str, Any]], changes: dict[str | int, Any]) -> None:
+        """Apply a listenergy payload, only channels whose value changed are dispatched."""
+        seen = set()
+        for _energy in energy:
+            entity = NHCEnergy(self, _energy)
+            seen.add(entity.action_id)
+            existing = self._energy.get(entity.action_id)
+            if existing is None or existing.name != entity.name or existing.type != entity.type:
+                if existing is not None:
+                    entity.history = existing.history
+                elif self._energy_history:
+                    entity.history = NHCEnergyBuffer(self._energy_history)
+                self._energy[entity.action_id] = entity
+                changed = existing is not None and existing.state != entity.state
+            else:
+                changed = existing.update_state(_energy["v"])
+            if changed:
+                changes[entity.id] = _energy["v"]
+                await self.async_dispatch_update(entity.id, _energy["v"])
+
+        for action_id in [action_id for action_id in self._energy if action_id not in seen]:
+            del self._energy[action_id]
+
+    async def _apply_discovery(self, command: str, data: Any, changes: dict[str | int, Any]) -> None:
+        """Apply the response of a discovery command, changed values are added to changes."""
+        self._discovery[command] = data
+        if command == "listlocations":
+            self._sync_locations(data)
+        elif command == "listthermostat":
+            await self._sync_thermostats(data, changes)
+        elif command == "listenergy":
+            await self._sync_energy(data, changes)
+        elif command == "systeminfo":
+            self._system_info = data
+        elif command == "listactions":
+            await self._sync_actions(data, changes)
+        # the topology may have changed, the routing table is rebuilt once per payload instead of per entity
+        self._router.invalidate()
+
+    async def _discover(self) -> None:
+        """Run all discovery commands, they are written back to back and their responses come back in order."""
+        requests = [
+            (command, '{"cmd": "%s"}' % command) for command in DISCOVERY_COMMANDS
+        ]
+        responses = [await self._request(data) for command, data in requests]
+        changes = {}
+        for index, ((command, data), response) in enumerate(zip(requests, responses)):
+            try:
+                # entities are built as their response arrives, the first ones are usable while listactions is on its way
+                await self._apply_discovery(command, await self._receive(data, response), changes)
+            except Exception:
+                # the later responses are still awaited, so none of their errors goes unretrieved
+                await asyncio.gather(*responses[index + 1:], return_exceptions=True)
+                raise
+        self._dispatch_changes(changes)
+
+    @property
+    def metrics(self) -> NHCMetrics | None:
+        return self._metrics
+
+    @property
+    def dispatcher(self) -> NHCDispatcher:
+        return self._dispatcher
+
+    @property
+    def _connections(self) -> tuple[NHCConnection, ...]:
+        if self._event_connection is self._connection:
+            return (self._connection,)
+        return (self._connection, self._event_connection)
+
+    @property
+    def latency(self) -> dict[str, dict[str, Any]]:
+        """Probe round trip times, stalls and write counts of the command and event connections (one unless dual)."""
+        return {
+            "commands": self._connection.stats(),
+            "events": self._event_connection.stats(),
+        }
+
+    @property
+    def history(self) -> NHCHistory | None:
+        return self._history
+
+    @property
+    def optimistic(self) -> NHCOptimistic | None:
+        return self._optimistic
+
+    @property
+    def dual_connection(self) -> bool:
+        return self._event_connection is not self._connection
+
+    @property
+    def connected(self) -> bool:
+        return all(connection.connected for connection in self._connections)
+
+    async def connect(self) -> None:
+        """Connect and discover the entities, on failure the connections are closed again so connect can be retried."""
+        self._closing = False
+        if self._history is not None:
+            await self._history.open()
+        try:
+            for connection in self._connections:
+                await connection.connect()
+                self._listen_tasks.append(asyncio.create_task(self._listen(connection)))
+
+            snapshot = None
+            if self._snapshot is not None:
+                # a snapshot is only trusted while the controller reports the same configuration and software
+                system_info = await self._send('{"cmd": "systeminfo"}')
+                snapshot = await asyncio.to_thread(self._snapshot.load, self._host, system_info or {})
+            if snapshot is not None:
+                # warm start, entities are usable right away and reconciled with the controller in the background
+                for command in DISCOVERY_COMMANDS:
+                    await self._apply_discovery(command, snapshot[command], {})
+                await self._event_connection.write('{"cmd":"startevents"}')
+                self._start_reconcile(self._reconcile())
+                return
+
+            await self._discover()
+            await self._event_connection.write('{"cmd":"startevents"}')
+            await self.save_snapshot()
+        except BaseException:
+            await self._stop_listening()
+            raise
+
+    async def _stop_listening(self) -> None:
+        """Cancel the listeners and close the connections."""
+        for task in self._listen_tasks:
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._listen_tasks.clear()
+        for connection in self._connections:
+            await connection.close()
+
+    async def _reconcile(self) -> None:
+        """Apply the differences between the known entities (snapshot or before a reconnect) and the controller."""
+        await self._discover()
+        await self.save_snapshot()
+
+    async def disconnect(self) -> None:
+        """Close the connection and stop reconnecting, queued commands are cancelled."""
+        self._closing = True
+        for task in (self._reconcile_task, *self._listen_tasks):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await self._jobs.close()
+        if self._optimistic is not None:
+            self._optimistic.close()
+        await self._dispatcher.close()
+        for subscription in tuple(self._subscriptions):
+            subscription.close()
+        for connection in self._connections:
+            await connection.close()
+        self._listen_tasks.clear()
+        if self._recorder is not None:
+            self._recorder.flush()
+        if self._history is not None:
+            await self._history.flush()
+        await self.save_snapshot()
+
+    def _snapshot_data(self) -> dict[str, Any]:
+        """The discovery payloads with the last known states filled in."""
+        actions = []
+        for _action in self._discovery.get("listactions", []):
+            action = self._actions_by_id.get(_action["id"])
+            if action is not None:
+                _action = {
+                    **_action,
+                    "value1": round(action.state / 2.55) if action.type == 2 else action.state,
+                }
+            actions.append(_action)
+
+        thermostats = []
+        for _thermostat in self._discovery.get("listthermostat", []):
+            thermostat = self._thermostats.get(_thermostat["id"])
+            if thermostat is not None:
+                _thermostat = {
+                    **_thermostat,
+                    "mode": thermostat.mode,
+                    "setpoint": round(thermostat.setpoint * 10),
+                    "measured": round(thermostat.measured * 10),
+                    "overrule": thermostat.overrule,
+                    "overruletime": thermostat.overruletime,
+                    "ecosave": thermostat.ecosave,
+                }
+            thermostats.append(_thermostat)
+
+        energy = []
+        for _energy in self._discovery.get("listenergy", []):
+            channel = self._energy.get(_energy["channel"])
+            if channel is not None:
+                _energy = {**_energy, "v": channel.state}
+            energy.append(_energy)
+
+        return {
+            "systeminfo": self._system_info,
+            "listlocations": self._discovery.get("listlocations", []),
+            "listthermostat": thermostats,
+            "listenergy": energy,
+            "listactions": actions,
+        }
+
+    async def save_snapshot(self) -> None:
+        """Save the topology and last known states, does nothing without a snapshot."""
+        if self._snapshot is not None and self._discovery:
+            await asyncio.to_thread(self._snapshot.save, self._host, self._snapshot_data())
+
+    @property
+    def rate_limiter(self) -> NHCRateLimiter | None:
+        return self._rate_limiter
+
+    def _check_response(self, response: dict[str, Any]) -> dict[str, Any] | None:
+        """Raise the error of a response, returns its data."""
         if 'error' in response['data']:
             error = response['data']['error']
             if error:
@@ -133,115 +518,504 @@ class NHCController:
                     raise Exception("ERROR")
                 raise UnknownError(error)
         return response['data']
+
+    async def _request(self, data: str) -> asyncio.Future:
+        """Write a command paced by the rate limiter, returns a future for its response."""
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire()
+        response = self._connection.request(data)
+        await self._connection.drain()
+        return response
+
+    async def _throttled(self, attempt: int) -> bool:
+        """Back off after an error 200, returns True when the command should be retried."""
+        if self._rate_limiter is None:
+            return False
+        self._rate_limiter.throttled()
+        if attempt >= self._rate_limiter.retries:
+            return False
+        await asyncio.sleep(self._rate_limiter.backoff(attempt))
+        return True
+
+    def _accepted(self) -> None:
+        if self._rate_limiter is not None:
+            self._rate_limiter.success()
+
+    async def _receive(self, data: str, response: asyncio.Future) -> dict[str, Any] | None:
+        """Wait for the response of a request, the request is sent again when throttled."""
+        for attempt in itertools.count():
+            try:
+                result = self._check_response(await response)
+            except ToManyRequestsOrSyntaxError:
+                if await self._throttled(attempt):
+                    response = await self._request(data)
+                    continue
+                raise
+            self._accepted()
+            return result
+
+    async def _send(self, data) -> dict[str, Any] | None:
+        return await self._receive(data, await self._request(data))
     
-    async def _handle_job(self, job):
-        self.jobs.append(job)
-        if not self.jobRunning:
-            await self.jobHandler()
-    
-    async def jobHandler(self):
-        '''Handle the job queue'''
-        if len(self.jobs) > 0 and not self.jobRunning:
-            self.jobRunning = True
-            job = self.jobs.pop(0)
-            await job()
-            self.jobRunning = False
-            await self.jobHandler()
+    async def _handle_job(self, job, key=None) -> None:
+        """
+        Queue a job and wait until the controller acknowledged it, jobs with the same key are coalesced when enabled.
+        Callers whose jobs were coalesced share one acknowledgement, so a throttled job is retried once (as the
+        newest job for its key) and the rate limiter sees every error once.
+        """
+        sequence = next(self._sequence)
+        if key is not None:
+            self._latest[key] = sequence
+        future = await self._jobs.put(self._tracked(job, sequence), key)
+        acknowledgement = self._acknowledgements.get(future)
+        if acknowledgement is None:
+            acknowledgement = self._acknowledgements[future] = asyncio.ensure_future(self._acknowledge(future, key))
+            # retrieved here when every caller was cancelled
+            acknowledgement.add_done_callback(lambda task: task.cancelled() or task.exception())
+        # one caller being cancelled must not cancel the acknowledgement the others wait for
+        await asyncio.shield(acknowledgement)
+
+    @staticmethod
+    def _tracked(job, sequence: int):
+        """Wrap a job so its result tells which job ran, coalescing replaces the job of a queued entry."""
+        async def run():
+            return job, sequence, await job()
+
+        return run
+
+    async def _acknowledge(self, future: asyncio.Future, key) -> None:
+        """Wait for the response of a queued job, a throttled job is queued again unless a newer one replaced it."""
+        task = asyncio.current_task()
+        futures = [future]
+        try:
+            for attempt in itertools.count():
+                job, sequence, response = await future
+                try:
+                    self._check_response(await response)
+                except ToManyRequestsOrSyntaxError:
+                    if not await self._throttled(attempt):
+                        raise
+                    if self._jobs.coalesce and key is not None and self._latest.get(key, sequence) > sequence:
+                        # a newer command for the key was queued meanwhile, last write wins
+                        return
+                    future = await self._jobs.put(self._tracked(job, sequence), key, replace=False)
+                    acknowledgement = self._acknowledgements.get(future)
+                    if acknowledgement is not None:
+                        await acknowledgement
+                        return
+                    self._acknowledgements[future] = task
+                    futures.append(future)
+                    continue
+                self._accepted()
+                return
+        finally:
+            for future in futures:
+                if self._acknowledgements.get(future) is task:
+                    del self._acknowledgements[future]
+            if key is not None and self._latest.get(key) == sequence:
+                del self._latest[key]
+
+    async def _handle_optimistic_job(self, job, key, entity, expected) -> None:
+        """Queue a job, with optimistic updates the expected state is applied right away and rolled back on failure."""
+        if self._optimistic is None or entity is None or expected is None:
+            await self._handle_job(job, key)
+            return
+        self._optimistic.apply(entity, expected)
+        try:
+            await self._handle_job(job, key)
+        except Exception:
+            self._optimistic.rollback(entity)
+            raise
 
     async def execute(self, id: int, value: int):
         """Add an action to jobs to make sure only one command happens at a time."""
         async def job():
-            await self._connection.write('{"cmd": "%s", "id": %s, "value1": %s}' % ("executeactions", id, value))
+            return await self._request('{"cmd": "%s", "id": %s, "value1": %s}' % ("executeactions", id, value))
         
-        await self._handle_job(job)
+        action = self._actions_by_id.get(id)
+        expected = None if action is None else action.expected_state(value)
+        await self._handle_optimistic_job(job, ("executeactions", id), action, expected)
 
     async def execute_thermostat_mode(self, id: int, mode: int, overruletime: str, overrule: int) -> None:
         """Add an action to jobs to make sure only one command happens at a time."""
         async def job():
-            await self._connection.write('{"cmd": "%s", "id": %s, "mode": %s}' % ("executethermostat", id, mode))
+            return await self._request('{"cmd": "%s", "id": %s, "mode": %s}' % ("executethermostat", id, mode))
         
-        await self._handle_job(job)
+        await self._handle_optimistic_job(job, ("executethermostat", id, "mode"), self._thermostats.get(id), {"mode": mode})
 
     async def execute_thermostat_set_temperature(self, id: int, setpoint: int) -> None:
         """Add an action to jobs to make sure only one command happens at a time."""
         async def job():
-            await self._connection.write('{"cmd": "%s", "id": %s, "overrule": %s, "overruletime": "23:59",}' % ("executethermostat", id, setpoint))
+            return await self._request('{"cmd": "%s", "id": %s, "overrule": %s, "overruletime": "23:59",}' % ("executethermostat", id, setpoint))
         
-        await self._handle_job(job)
+        await self._handle_optimistic_job(
+            job,
+            ("executethermostat", id, "overrule"),
+            self._thermostats.get(id),
+            {"overrule": setpoint, "overruletime": "23:59"},
+        )
+
+    async def execute_group(self, commands: Mapping[int, int]) -> dict[int, Exception]:
+        """
+        Execute many actions at once, mapping action id to value. All commands are queued together so the job queue and
+        rate limiter pace them, returns once all are acknowledged with the error of every action that failed.
+        """
+        ids = list(commands)
+        results = await asyncio.gather(
+            *(self.execute(id, commands[id]) for id in ids), return_exceptions=True
+        )
+        return {id: result for id, result in zip(ids, results) if isinstance(result, Exception)}
+
+    def _group(self, bucket: str, location: str | None, ids: Iterable[int] | None) -> list[NHCScene | NHCLight | NHCCover | NHCFan]:
+        """The actions of a typed view, limited to a location and/or an id set."""
+        actions = self._actions_by_type[bucket]
+        if location is not None:
+            actions = [action for action in self.get_actions_by_location(location) if self._action_bucket(action) == bucket]
+        if ids is not None:
+            ids = set(ids)
+            actions = [action for action in actions if action.id in ids]
+        return actions
+
+    async def turn_on_lights(
+        self, location: str | None = None, ids: Iterable[int] | None = None, brightness: int | None = None
+    ) -> dict[int, Exception]:
+        """Turn on all lights, or those in a location and/or id set."""
+        return await self.execute_group(
+            {light.id: light.turn_on_value(brightness) for light in self._group("lights", location, ids)}
+        )
+
+    async def turn_off_lights(self, location: str | None = None, ids: Iterable[int] | None = None) -> dict[int, Exception]:
+        """Turn off all lights, or those in a location and/or id set."""
+        return await self.execute_group(
+            {light.id: light.turn_off_value() for light in self._group("lights", location, ids)}
+        )
+
+    async def open_covers(self, location: str | None = None, ids: Iterable[int] | None = None) -> dict[int, Exception]:
+        """Open all covers, or those in a location and/or id set."""
+        return await self.execute_group({cover.id: COVER_OPEN for cover in self._group("covers", location, ids)})
+
+    async def close_covers(self, location: str | None = None, ids: Iterable[int] | None = None) -> dict[int, Exception]:
+        """Close all covers, or those in a location and/or id set."""
+        return await self.execute_group({cover.id: COVER_CLOSE for cover in self._group("covers", location, ids)})
+
+    async def stop_covers(self, location: str | None = None, ids: Iterable[int] | None = None) -> dict[int, Exception]:
+        """Stop all covers, or those in a location and/or id set."""
+        return await self.execute_group({cover.id: COVER_STOP for cover in self._group("covers", location, ids)})
 
     def register_callback(
-        self, action_id: str, callback: Callable[[int], Awaitable[None]]
+        self, action_id: str, callback: Callable[[int], Awaitable[None]], always: bool = False
     ) -> Callable[[], None]:
-        """Register a callback for entity updates."""
-        self._callbacks.setdefault(action_id, []).append(callback)
+        """Register a callback for entity updates, with always it is also called when the state did not change."""
+        subscriber = self._dispatcher.subscribe(callback, always)
+        self._router.add(action_id, subscriber)
 
         def remove_callback() -> None:
-            self._callbacks[action_id].remove(callback)
-            if not self._callbacks[action_id]:
-                del self._callbacks[action_id]
+            self._dispatcher.unsubscribe(subscriber)
+            self._router.remove(action_id, subscriber)
 
         return remove_callback
 
+    def register_group_callback(
+        self,
+        callback: Callable[[str | int, Any], Awaitable[None]],
+        types: Iterable[str] | None = None,
+        locations: Iterable[str | None] | None = None,
+        ids: Iterable[str | int] | None = None,
+        always: bool = False,
+    ) -> Callable[[], None]:
+        """
+        Register a callback for the updates of a group of entities, called with the entity id and its value.
+        Filters are combined, None matches everything: types ("scenes", "lights", "covers", "fans", "thermostats",
+        "energy"), locations (suggested areas) and ids. Without filters it receives every update.
+        """
+        async def route(value: tuple[str | int, Any]) -> None:
+            await callback(*value)
+
+        subscriber = self._dispatcher.subscribe(route, always, callback_name(callback))
+        group = NHCRoute(subscriber, types, locations, ids)
+        self._router.add_route(group)
+
+        def remove_callback() -> None:
+            self._dispatcher.unsubscribe(subscriber)
+            self._router.remove_route(group)
+
+        return remove_callback
+
+    def _routing_entities(self) -> Iterable[tuple[str | int, str | None, str | None]]:
+        """The id, type and location of every entity, for the routing table."""
+        for action in self._actions_by_id.values():
+            yield action.id, self._action_bucket(action), action.suggested_area
+        for thermostat in self._thermostats.values():
+            yield thermostat.id, "thermostats", thermostat.suggested_area
+        for energy in self._energy.values():
+            yield energy.id, "energy", energy.suggested_area
+
     def register_alarm_callback(
         self, callback: Callable[[int], Awaitable[None]]
     ) -> Callable[[], None]:
         """Register a callback for alarm updates."""
-        self._alarm_callbacks.append(callback)
+        subscriber = self._dispatcher.subscribe(callback)
+        self._alarm_callbacks.append(subscriber)
 
         def remove_callback() -> None:
-            self._alarm_callbacks.remove(callback)
+            self._dispatcher.unsubscribe(subscriber)
+            self._alarm_callbacks.remove(subscriber)
 
         return remove_callback
 
-    async def async_dispatch_update(self, action_id: str, value: int) -> None:
-        """Dispatch an update to all registered callbacks."""
-        for callback in self._callbacks.get(action_id, []):
-            await callback(value)
-
-    async def handle_event(self, event: NHCActionEvent) -> None:
-        """Handle an event."""
-        for action in self._actions:
-            if action.id == event["id"]:
-                action.update_state(event["value1"])
-      
-        await self.async_dispatch_update(event["id"], event["value1"])
-
-    async def handle_energy_event(self, event: NHCEnergyEvent) -> None:
-        """Handle an energy event."""
-        entity = self._energy[event['channel']]
-        entity.update_state(event["v"])
-        await self.async_dispatch_update(entity.id, event["v"])
-
-    async def handle_thermostat_event(self, event: NHCThermostatEvent) -> None:
-        """Handle an energy event."""
-        entity = self._thermostats[event['id']]
-        entity.update_state(event)
-        await self.async_dispatch_update(entity.id, event)
+    def register_batch_callback(
+        self, callback: Callable[[dict[str | int, Any]], Awaitable[None]]
+    ) -> Callable[[], None]:
+        """Register a callback receiving all changes of one event frame (or resync) at once, keyed by entity id."""
+        subscriber = self._dispatcher.subscribe(callback)
+        self._batch_callbacks.append(subscriber)
+
+        def remove_callback() -> None:
+            self._dispatcher.unsubscribe(subscriber)
+            self._batch_callbacks.remove(subscriber)
+
+        return remove_callback
+
+    def events(
+        self,
+        kinds: Iterable[str] | None = None,
+        types: Iterable[str] | None = None,
+        ids: Iterable[Hashable] | None = None,
+        locations: Iterable[str] | None = None,
+        max_size: int = 100,
+        policy: str = EVENT_POLICY_DROP_OLDEST,
+        always: bool = False,
+    ) -> NHCEventSubscription:
+        """
+        Subscribe to events with their own bounded queue, use as `async for event in controller.events(...)`.
+        Events are NHCActionEvent, NHCEnergyEvent, NHCThermostatEvent or NHCAlarmEvent, see NHCEventSubscription.
+        The block policy needs dual_connection, on a single connection a full queue would also hold back the responses
+        and a command awaited while iterating would never complete.
+        """
+        if policy == EVENT_POLICY_BLOCK and not self.dual_connection:
+            raise ValueError("the block policy needs dual_connection")
+        subscription = NHCEventSubscription(
+            kinds, types, ids, locations, max_size, policy, always, on_close=self._subscriptions.remove
+        )
+        self._subscriptions.append(subscription)
+        return subscription
+
+    async def _publish(
+        self, kind: str, type: str | None, id: Hashable | None, location: str | None, event: Any, changed: bool
+    ) -> None:
+        """Queue an event for the matching subscriptions."""
+        for subscription in tuple(self._subscriptions):
+            if (changed or subscription.always) and subscription.matches(kind, type, id, location):
+                await subscription.put(id, event)
+
+    async def async_dispatch_update(self, action_id: str, value: int, changed: bool = True) -> None:
+        """
+        Dispatch an update to all registered callbacks, callbacks run on the dispatcher and are not awaited.
+        Unchanged values only go to callbacks registered with always.
+        """
+        callbacks, groups = self._router.lookup(action_id)
+        for subscriber in callbacks:
+            if changed or subscriber.always:
+                self._dispatcher.dispatch(subscriber, value)
+        if groups:
+            routed = (action_id, value)
+            for subscriber in groups:
+                if changed or subscriber.always:
+                    self._dispatcher.dispatch(subscriber, routed)
+
+    def _dispatch_state(self, action_id: str | int, value: Any) -> None:
+        """Dispatch an optimistic or rolled back state, it is not an event so subscriptions do not see it."""
+        callbacks, groups = self._router.lookup(action_id)
+        for subscriber in callbacks:
+            self._dispatcher.dispatch(subscriber, value)
+        for subscriber in groups:
+            self._dispatcher.dispatch(subscriber, (action_id, value))
+        self._dispatch_changes({action_id: value}, optimistic=True)
+
+    def _dispatch_changes(self, changes: dict[str | int, Any], optimistic: bool = False) -> None:
+        """Dispatch the changes of one frame to the batch callbacks, and record them unless they are optimistic."""
+        if changes:
+            if self._history is not None and not optimistic:
+                self._history.record(changes)
+            for subscriber in self._batch_callbacks:
+                self._dispatcher.dispatch(subscriber, changes)
+            if self.on_changes is not None:
+                self.on_changes(self, changes)
+
+    def _record_confirmed(self, entity_id: str | int, value: Any) -> None:
+        """
+        Record a confirmed optimistic state, the event does not change the entity (it already shows the expected state)
+        but the transition was never recorded, optimistic states are not.
+        """
+        if self._history is not None:
+            self._history.record({entity_id: value})
+
+    async def handle_event(self, event: NHCActionEvent, changes: dict[str | int, Any] | None = None) -> None:
+        """Handle an event, changed values are added to changes."""
+        action = self._actions_by_id.get(event["id"])
+        pending = action is not None and action.pending
+        if pending:
+            self._optimistic.resolve(action, event["value1"])
+        changed = action is None or action.update_state(event["value1"])
+        if changed and changes is not None:
+            changes[event["id"]] = event["value1"]
+        elif pending:
+            self._record_confirmed(action.id, event["value1"])
+        await self.async_dispatch_update(event["id"], event["value1"], changed)
+        if self._subscriptions:
+            await self._publish(
+                "action",
+                None if action is None else self._action_bucket(action),
+                event["id"],
+                None if action is None else action.suggested_area,
+                NHCActionEvent(event),
+                changed,
+            )
+
+    async def handle_energy_event(self, event: NHCEnergyEvent, changes: dict[str | int, Any] | None = None) -> None:
+        """Handle an energy event, changed values are added to changes."""
+        entity = self._energy.get(event['channel'])
+        if entity is None:
+            # a channel added since the last discovery, the reconcile after (re)connecting picks it up
+            return
+        if entity.history is not None:
+            entity.history.append(event["v"])
+        changed = entity.update_state(event["v"])
+        if changed and changes is not None:
+            changes[entity.id] = event["v"]
+        await self.async_dispatch_update(entity.id, event["v"], changed)
+        if self._subscriptions:
+            await self._publish("energy", "energy", entity.id, entity.suggested_area, NHCEnergyEvent(event), changed)
+
+    async def handle_thermostat_event(self, event: NHCThermostatEvent, changes: dict[str | int, Any] | None = None) -> None:
+        """Handle a thermostat event, changed values are added to changes."""
+        entity = self._thermostats.get(event['id'])
+        if entity is None:
+            return
+        pending = entity.pending
+        if pending:
+            self._optimistic.resolve(entity, event)
+        changed = entity.update_state(event)
+        if changed and changes is not None:
+            changes[entity.id] = event
+        elif pending:
+            self._record_confirmed(entity.id, event)
+        await self.async_dispatch_update(entity.id, event, changed)
+        if self._subscriptions:
+            await self._publish(
+                "thermostat", "thermostats", entity.id, entity.suggested_area, NHCThermostatEvent(event), changed
+            )
 
     async def handle_alarm_event(self, event: NHCAlarmEvent) -> None:
         """Handle an alarm event."""
-        for callback in self._alarm_callbacks:
-            await callback(event)
+        for subscriber in self._alarm_callbacks:
+            self._dispatcher.dispatch(subscriber, event)
+        if self._subscriptions:
+            await self._publish("alarm", None, None, None, event, True)
+
+    def _wants_event(self, event: str) -> bool:
+        """Whether an event type has anything to update or notify, other events are not decoded."""
+        if event == "startevents":
+            return False
+        if event == "getlive":
+            return bool(self._energy)
+        if event == "listthermostat":
+            return bool(self._thermostats)
+        if event == "getalarms":
+            return bool(self._alarm_callbacks) or bool(self._subscriptions)
+        return True
+
+    async def _handle_message(self, message: dict[str, Any]) -> None:
+        """Route an event message to its handler, a frame that fails to apply is skipped and the listener goes on."""
+        if message["event"] == "startevents":
+            return
+        changes = {}
+        try:
+            if message["event"] == "getlive":
+                await self.handle_energy_event(message["data"], changes)
+            elif message["event"] == "listthermostat":
+                for data in message["data"]:
+                    await self.handle_thermostat_event(data, changes)
+            elif message["event"] == "getalarms":
+                await self.handle_alarm_event(NHCAlarmEvent(message["data"]))
+            else:
+                for data in message["data"]:
+                    await self.handle_event(data, changes)
+        except (KeyError, TypeError, ValueError):
+            _LOGGER.exception("Skipped %s event that could not be applied", message["event"])
+        self._dispatch_changes(changes)
 
-    async def _listen(self) -> None:
+    async def feed(self, frame: bytes) -> None:
         """
-        Listen for events. When an event is received, call callback functions.
+        Handle a frame as if it was received, used to replay recordings (see NHCReplayer). Discovery responses
+        rebuild the entities, other responses are ignored.
+        """
+        connection = self._event_connection
+        if connection.decoder.event_type(frame) is not None:
+            await connection.feed(frame, self._handle_message, self._wants_event)
+            return
+        if not frame.strip():
+            return
+        message = connection.decoder.loads(frame)
+        if message.get("cmd") in DISCOVERY_COMMANDS:
+            changes = {}
+            await self._apply_discovery(message["cmd"], message["data"], changes)
+            self._dispatch_changes(changes)
+
+    def _start_reconcile(self, coroutine: Awaitable[None]) -> None:
+        """Run a reconcile in the background, a failed one is logged and retried on the next reconnect."""
+        self._reconcile_task = asyncio.create_task(coroutine)
+        self._reconcile_task.add_done_callback(self._reconciled)
+
+    @staticmethod
+    def _reconciled(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.error("Reconciling with the controller failed", exc_info=task.exception())
+
+    async def _resync(self) -> None:
+        """Restart events after a reconnect and apply what changed while offline."""
+        await self._event_connection.write('{"cmd":"startevents"}')
+        await self._reconcile()
+
+    async def _listen(self, connection: NHCConnection) -> None:
+        """
+        Listen for responses and events. When an event is received, call callback functions.
+        When the connection drops it is re-established with exponential backoff, the state is resynchronised when it
+        is the connection carrying the events.
         """
         try:
-            await self._connection.write('{"cmd":"startevents"}')
-
-            async for line in self._connection.reader:
-                message = json.loads(line.decode())
-                if "event" in message and message["event"] != "startevents":
-                    if message["event"] == "getlive":
-                        await self.handle_energy_event(message["data"])
-                    elif message["event"] == "listthermostat":
-                        for data in message["data"]:
-                            await self.handle_thermostat_event(data)
-                    elif message["event"] == "getalarms":
-                        await self.handle_alarm_event(NHCAlarmEvent(message["data"]))
-                    else:
-                        for data in message["data"]:
-                            await self.handle_event(data)
+            while True:
+                try:
+                    await connection.listen(self._handle_message, self._wants_event)
+                    error = "closed by the controller"
+                except (OSError, asyncio.IncompleteReadError, ValueError) as err:
+                    # ValueError is a line over the read limit, malformed lines are skipped by the connection
+                    error = err
+                except Exception:
+                    # a failing callback or handler must not end the supervisor, reconnect and resynchronise instead
+                    _LOGGER.exception("Listener failed, reconnecting")
+                    error = "listener failed"
+                await connection.close()
+                if self._closing:
+                    return
+                _LOGGER.warning("Connection to %s:%s lost: %s", self._host, self._port, error)
+                if not self._reconnect:
+                    return
+
+                delay = self._reconnect_delay
+                while True:
+                    await asyncio.sleep(delay)
+                    try:
+                        await connection.connect()
+                        break
+                    except (OSError, asyncio.TimeoutError) as err:
+                        delay = min(delay * 2, self._max_reconnect_delay)
+                        _LOGGER.debug(
+                            "Reconnecting to %s:%s failed (%s), retrying in %s seconds",
+                            self._host, self._port, str(err) or type(err).__name__, delay,
+                        )
+                _LOGGER.info("Reconnected to %s:%s", self._host, self._port)
+                if connection is self._event_connection:
+                    self._start_reconcile(self._resync())
         finally:
-            await self._connection.close()
+            await connection.close()
@@ -2,11 +2,20 @@ from .action import NHCAction
 from .const import COVER_OPEN, COVER_CLOSE, COVER_STOP
 
 class NHCCover(NHCAction):
+    __slots__ = ()
 
     @property
     def is_open(self) -> bool:
         return self._state > 0
 
+    def expected_state(self, value: int) -> int | None:
+        """Open and close end fully open or closed, where a stopped cover ends is not known."""
+        if value == COVER_OPEN:
+            return 100
+        if value == COVER_CLOSE:
+            return 0
+        return None
+
     async def open(self) -> None:
         await self._controller.execute(self.id, COVER_OPEN)
 
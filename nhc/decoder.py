@@ -0,0 +1,40 @@
+import json
+import re
+from collections.abc import Callable
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+EVENT_PATTERN = re.compile(rb'"event"\s*:\s*"(\w+)"')
+
+class NHCDecoder:
+    """
+    Decodes frames straight from bytes, with orjson when it is installed and the json module otherwise.
+    The event type of a frame can be read without decoding it, so frames nobody handles are never decoded.
+    """
+    loads: Callable[[bytes], Any]
+
+    def __init__(self, backend: str | None = None) -> None:
+        if backend is None:
+            backend = "json" if orjson is None else "orjson"
+        if backend == "orjson":
+            if orjson is None:
+                raise ValueError("orjson is not installed")
+            self.loads = orjson.loads
+        elif backend == "json":
+            self.loads = json.loads
+        else:
+            raise ValueError(f"unknown backend: {backend}")
+        self._backend = backend
+
+    @property
+    def backend(self) -> str:
+        return self._backend
+
+    def event_type(self, data: bytes) -> str | None:
+        """The event type of an event frame, None for a response."""
+        match = EVENT_PATTERN.search(data)
+        return match.group(1).decode() if match else None
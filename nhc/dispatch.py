@@ -0,0 +1,140 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from typing import Any
+from .metrics import NHCMetrics
+
+_LOGGER = logging.getLogger(__name__)
+_SUBSCRIBER_IDS = itertools.count(1)
+
+def callback_name(callback: Callable) -> str:
+    """The qualified name of a callback, as shown in the stats and metrics."""
+    return getattr(callback, "__qualname__", repr(callback))
+
+class NHCSubscriber:
+    """A registered callback with its own bounded backlog and metrics."""
+    __slots__ = (
+        "callback",
+        "name",
+        "key",
+        "always",
+        "backlog",
+        "task",
+        "dispatched",
+        "dropped",
+        "timeouts",
+        "errors",
+        "slow",
+        "max_duration",
+    )
+
+    def __init__(
+        self, callback: Callable[[Any], Awaitable[None]], always: bool = False, name: str | None = None
+    ) -> None:
+        self.callback = callback
+        # the name of the user callback in the stats and metrics, callback may be a wrapper around it
+        self.name = name if name is not None else callback_name(callback)
+        # the same callback is often registered many times (a bound method per entity), the key tells them apart
+        self.key = f"{self.name}#{next(_SUBSCRIBER_IDS)}"
+        self.always = always
+        self.backlog: deque[Any] = deque()
+        self.task: asyncio.Task | None = None
+        self.dispatched = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.slow = 0
+        self.max_duration = 0.0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "callback": self.name,
+            "key": self.key,
+            "backlog": len(self.backlog),
+            "dispatched": self.dispatched,
+            "dropped": self.dropped,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "slow": self.slow,
+            "max_duration": self.max_duration,
+        }
+
+class NHCDispatcher:
+    """
+    Runs callbacks off the listener. Every subscriber has its own backlog and runs on its own task while it has work,
+    so a slow subscriber only delays itself. When a backlog is full the oldest value is dropped.
+    """
+
+    def __init__(self, max_backlog: int = 100, timeout: float = 10, slow: float = 1) -> None:
+        self._max_backlog = max_backlog
+        self._timeout = timeout
+        self._slow = slow
+        self._subscribers: set[NHCSubscriber] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self.metrics: NHCMetrics | None = None
+
+    def subscribe(
+        self, callback: Callable[[Any], Awaitable[None]], always: bool = False, name: str | None = None
+    ) -> NHCSubscriber:
+        """
+        Add a subscriber, with always it also receives values that did not change. name defaults to the qualified name
+        of the callback.
+        """
+        subscriber = NHCSubscriber(callback, always, name)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: NHCSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+        if self.metrics is not None:
+            self.metrics.callbacks.pop(subscriber.key, None)
+
+    def dispatch(self, subscriber: NHCSubscriber, value: Any) -> None:
+        """Queue a value for a subscriber without waiting for it."""
+        if len(subscriber.backlog) >= self._max_backlog:
+            subscriber.backlog.popleft()
+            subscriber.dropped += 1
+        subscriber.backlog.append(value)
+        if subscriber.task is None:
+            subscriber.task = asyncio.create_task(self._run(subscriber))
+            self._tasks.add(subscriber.task)
+            subscriber.task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, subscriber: NHCSubscriber) -> None:
+        """Run the callback for every value in the backlog, one at a time."""
+        try:
+            while subscriber.backlog:
+                value = subscriber.backlog.popleft()
+                start = time.monotonic()
+                try:
+                    await asyncio.wait_for(subscriber.callback(value), self._timeout)
+                except asyncio.TimeoutError:
+                    subscriber.timeouts += 1
+                    _LOGGER.warning("Callback %s timed out after %s seconds", subscriber.name, self._timeout)
+                except Exception:
+                    subscriber.errors += 1
+                    _LOGGER.exception("Error in callback %s", subscriber.name)
+                duration = time.monotonic() - start
+                subscriber.dispatched += 1
+                if duration > subscriber.max_duration:
+                    subscriber.max_duration = duration
+                if duration > self._slow:
+                    subscriber.slow += 1
+                if self.metrics is not None:
+                    self.metrics.record_callback(subscriber.key, duration)
+        finally:
+            subscriber.task = None
+
+    def stats(self) -> list[dict[str, Any]]:
+        """Metrics of all subscribers, to find dropped or slow callbacks."""
+        return [subscriber.stats() for subscriber in self._subscribers]
+
+    async def close(self) -> None:
+        """Cancel all running callbacks."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
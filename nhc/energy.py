@@ -1,10 +1,26 @@
 from .action import NHCEnergyAction
+from .timeseries import NHCEnergyBuffer
 
 class NHCEnergy(NHCEnergyAction):
+    __slots__ = ("_history",)
+
+    def __init__(self, controller, action):
+        super().__init__(controller, action)
+        self._history = None
+
     @property
     def id(self):
         return f"energy-{self._id}"
     
     @property
     def action_id(self):
-        return self._id
\ No newline at end of file
+        return self._id
+
+    @property
+    def history(self) -> NHCEnergyBuffer | None:
+        """The recent samples, None unless the controller keeps energy history."""
+        return self._history
+
+    @history.setter
+    def history(self, history: NHCEnergyBuffer | None) -> None:
+        self._history = history
@@ -6,4 +6,7 @@ class ToManyRequestsOrSyntaxError(Exception):
     pass
 
 class ConnectionError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class JobQueueFullError(Exception):
+    pass
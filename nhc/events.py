@@ -1,4 +1,6 @@
 class NHCActionEvent:
+    __slots__ = ("_id", "_value1")
+
     @property
     def value1(self) -> int:
         return self._value1
@@ -12,6 +14,8 @@ class NHCActionEvent:
         self._value1 = event["value1"]
 
 class NHCEnergyEvent():
+    __slots__ = ("_channel", "_v")
+
     @property
     def channel(self) -> int:
         return self._channel
@@ -25,6 +29,8 @@ class NHCEnergyEvent():
         self._v = event["v"]
 
 class NHCThermostatEvent(): 
+    __slots__ = ("_id", "_mode", "_setpoint", "_measured", "_overrule", "_overruletime", "_ecosave")
+
     @property
     def id(self) -> int:
         return self._id
@@ -63,6 +69,8 @@ class NHCThermostatEvent():
         self._ecosave = event["ecosave"]
 
 class NHCAlarmEvent():
+    __slots__ = ("_id", "_type", "_text")
+
     @property
     def id(self) -> int:
         return self._id
@@ -2,6 +2,7 @@ from .action import NHCAction
 from .const import PRESET_MODES, MODES
 
 class NHCFan(NHCAction):
+  __slots__ = ()
 
   @property
   def modes(self) -> list:
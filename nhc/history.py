@@ -0,0 +1,172 @@
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from collections.abc import Hashable, Mapping
+from concurrent.futures import Future
+from typing import Any
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS states (entity TEXT NOT NULL, timestamp REAL NOT NULL, value NUMERIC, data TEXT)",
+    "CREATE INDEX IF NOT EXISTS states_entity_timestamp ON states (entity, timestamp)",
+)
+
+class NHCHistory:
+    """
+    Records state changes in a SQLite database.
+
+    Changes are buffered on the event loop and written in batches by a worker thread, a batch is handed over when it
+    reaches batch_size changes or flush_interval seconds after its first change. While the worker falls behind the
+    buffer holds at most max_buffer changes, the oldest are dropped. Thermostat states are stored as json.
+
+    The database is opened by the worker, await open (the controller does on connect) to wait for it and raise its
+    errors, changes recorded before are kept in the buffer.
+    """
+
+    def __init__(
+        self, path: str, batch_size: int = 500, flush_interval: float = 1, max_buffer: int = 10000
+    ) -> None:
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._buffer: deque[tuple[str, float, Any]] = deque(maxlen=max_buffer)
+        self._batches: queue.Queue = queue.Queue(maxsize=4)
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self.recorded = 0
+        self.dropped = 0
+        self.failed = 0
+        self._ready: Future = Future()
+        self._worker = threading.Thread(target=self._run, name="nhc-history", daemon=True)
+        self._worker.start()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    async def open(self) -> None:
+        """Wait until the worker opened the database, without blocking the event loop."""
+        await asyncio.wrap_future(self._ready)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self._path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _run(self) -> None:
+        """The worker thread, writes the batches until it receives None."""
+        try:
+            connection = self._connect()
+            for statement in SCHEMA:
+                connection.execute(statement)
+            connection.commit()
+        except Exception as error:
+            self._ready.set_exception(error)
+            return
+        self._ready.set_result(None)
+        with connection:
+            while True:
+                batch, done = self._batches.get()
+                if batch:
+                    rows = [
+                        (entity, timestamp, None, json.dumps(value)) if isinstance(value, dict)
+                        else (entity, timestamp, value, None)
+                        for entity, timestamp, value in batch
+                    ]
+                    try:
+                        connection.executemany("INSERT INTO states VALUES (?, ?, ?, ?)", rows)
+                        connection.commit()
+                    except sqlite3.Error:
+                        # a failing disk loses the batch, not the worker
+                        connection.rollback()
+                        self.failed += len(rows)
+                if done is not None:
+                    done.set_result(None)
+                if batch is None:
+                    break
+        connection.close()
+
+    def record(self, changes: Mapping[Hashable, Any], timestamp: float | None = None) -> None:
+        """Buffer the changes of one frame, keyed by entity id."""
+        timestamp = time.time() if timestamp is None else timestamp
+        buffer = self._buffer
+        for entity_id, value in changes.items():
+            if len(buffer) == buffer.maxlen:
+                self.dropped += 1
+            buffer.append((str(entity_id), timestamp, value))
+        self.recorded += len(changes)
+        if len(buffer) >= self._batch_size:
+            self._hand_off()
+        elif self._flush_handle is None and buffer:
+            self._flush_handle = asyncio.get_running_loop().call_later(self._flush_interval, self._hand_off)
+
+    def _hand_off(self, done: Future | None = None) -> bool:
+        """Pass the buffer to the worker, it stays buffered while the worker is busy with earlier batches."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        try:
+            self._batches.put_nowait((list(self._buffer), done))
+        except queue.Full:
+            self._flush_handle = asyncio.get_running_loop().call_later(self._flush_interval, self._hand_off)
+            return False
+        self._buffer.clear()
+        return True
+
+    async def flush(self) -> None:
+        """Write everything buffered and wait until it is in the database."""
+        await self.open()
+        done: Future = Future()
+        while not self._hand_off(done):
+            await asyncio.sleep(0.01)
+        await asyncio.wrap_future(done)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._worker.is_alive():
+            self._batches.put((None, None))
+            await asyncio.to_thread(self._worker.join)
+
+    def _query(self, sql: str, parameters: tuple) -> list[tuple]:
+        connection = self._connect()
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+
+    async def states(
+        self, entity_id: Hashable, start: float | None = None, end: float | None = None
+    ) -> list[tuple[float, Any]]:
+        """The states of an entity as (timestamp, value) between start and end (unix time), buffered ones included."""
+        await self.flush()
+        rows = await asyncio.to_thread(
+            self._query,
+            "SELECT timestamp, value, data FROM states WHERE entity = ? AND timestamp >= ? AND timestamp <= ?"
+            " ORDER BY timestamp",
+            (str(entity_id), float("-inf") if start is None else start, float("inf") if end is None else end),
+        )
+        return [(timestamp, json.loads(data) if data is not None else value) for timestamp, value, data in rows]
+
+    async def downsample(
+        self, entity_id: Hashable, interval: float, start: float | None = None, end: float | None = None
+    ) -> list[tuple[float, float, float, float]]:
+        """
+        The values of an entity (an energy channel) per interval seconds as (start, mean, min, max), for charts over
+        long ranges without reading every sample.
+        """
+        await self.flush()
+        return await asyncio.to_thread(
+            self._query,
+            "SELECT CAST(timestamp / ? AS INTEGER) * ? AS bucket, AVG(value), MIN(value), MAX(value) FROM states"
+            " WHERE entity = ? AND timestamp >= ? AND timestamp <= ? AND value IS NOT NULL"
+            " GROUP BY bucket ORDER BY bucket",
+            (
+                interval,
+                interval,
+                str(entity_id),
+                float("-inf") if start is None else start,
+                float("inf") if end is None else end,
+            ),
+        )
@@ -0,0 +1,169 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from typing import Any
+from .controller import NHCController
+from .dispatch import NHCDispatcher, NHCSubscriber, callback_name
+from .scene import NHCScene
+from .light import NHCLight
+from .cover import NHCCover
+from .fan import NHCFan
+
+class NHCHub:
+    """
+    Many controllers (sites) on one event loop.
+
+    Every controller keeps its own entities, job queue and reconnect loop, the hub connects them together and offers
+    one view of their entities and changes. Changes of all sites are routed to the hub callbacks through one shared
+    dispatcher, a hub callback runs on a single task whatever the number of sites.
+    """
+
+    def __init__(self, dispatcher: NHCDispatcher | None = None) -> None:
+        self._controllers: dict[str, NHCController] = {}
+        self._sites: dict[NHCController, str] = {}
+        self._dispatcher = dispatcher if dispatcher is not None else NHCDispatcher()
+        # hub callbacks by site, None holds the ones for all sites
+        self._routes: dict[str | None, list[NHCSubscriber]] = {}
+
+    @property
+    def controllers(self) -> dict[str, NHCController]:
+        return self._controllers
+
+    @property
+    def dispatcher(self) -> NHCDispatcher:
+        return self._dispatcher
+
+    def __len__(self) -> int:
+        return len(self._controllers)
+
+    def __contains__(self, site: str) -> bool:
+        return site in self._controllers
+
+    def __getitem__(self, site: str) -> NHCController:
+        return self._controllers[site]
+
+    def add(self, site: str, controller: NHCController) -> NHCController:
+        """Add a controller under a site name, connect it with connect or connect_site."""
+        if site in self._controllers:
+            raise ValueError(f"site {site} already exists")
+        self._controllers[site] = controller
+        self._sites[controller] = site
+        controller.on_changes = self._route
+        return controller
+
+    async def remove(self, site: str) -> None:
+        """Disconnect a site and remove it with its callbacks."""
+        controller = self._controllers.pop(site)
+        del self._sites[controller]
+        controller.on_changes = None
+        for subscriber in self._routes.pop(site, ()):
+            self._dispatcher.unsubscribe(subscriber)
+        await controller.disconnect()
+
+    async def connect_site(self, site: str) -> None:
+        await self._controllers[site].connect()
+
+    async def connect(self) -> dict[str, Exception]:
+        """Connect all sites concurrently, returns the error of every site that failed to connect."""
+        sites = list(self._controllers)
+        results = await asyncio.gather(*(self.connect_site(site) for site in sites), return_exceptions=True)
+        return {site: result for site, result in zip(sites, results) if isinstance(result, Exception)}
+
+    async def disconnect(self) -> None:
+        await asyncio.gather(*(controller.disconnect() for controller in self._controllers.values()))
+        await self._dispatcher.close()
+
+    @property
+    def connected(self) -> dict[str, bool]:
+        return {site: controller.connected for site, controller in self._controllers.items()}
+
+    def get(self, site: str, entity_id: int | str) -> Any:
+        """An action, thermostat or energy channel of a site by its entity id."""
+        controller = self._controllers[site]
+        action = controller.get_action(entity_id)
+        if action is not None:
+            return action
+        for entity in (*controller.thermostats.values(), *controller.energy.values()):
+            if entity.id == entity_id:
+                return entity
+        return None
+
+    def _actions(self, bucket: str) -> Iterator[tuple[str, NHCScene | NHCLight | NHCCover | NHCFan]]:
+        for site, controller in self._controllers.items():
+            for action in getattr(controller, bucket):
+                yield site, action
+
+    @property
+    def actions(self) -> Iterator[tuple[str, NHCScene | NHCLight | NHCCover | NHCFan]]:
+        """All actions of all sites as (site, action)."""
+        for site, controller in self._controllers.items():
+            for action in controller.actions:
+                yield site, action
+
+    @property
+    def scenes(self) -> Iterator[tuple[str, NHCScene]]:
+        return self._actions("scenes")
+
+    @property
+    def lights(self) -> Iterator[tuple[str, NHCLight]]:
+        return self._actions("lights")
+
+    @property
+    def covers(self) -> Iterator[tuple[str, NHCCover]]:
+        return self._actions("covers")
+
+    @property
+    def fans(self) -> Iterator[tuple[str, NHCFan]]:
+        return self._actions("fans")
+
+    def get_actions_by_location(self, location: str | None) -> list[tuple[str, NHCScene | NHCLight | NHCCover | NHCFan]]:
+        """The actions in a location (suggested area) of every site, as (site, action)."""
+        return [
+            (site, action)
+            for site, controller in self._controllers.items()
+            for action in controller.get_actions_by_location(location)
+        ]
+
+    def register_callback(
+        self, callback: Callable[[str, dict[str | int, Any]], Awaitable[None]], sites: Iterable[str] | None = None
+    ) -> Callable[[], None]:
+        """Register a callback for the changes of every frame, called with the site and the changes by entity id."""
+        async def route(value: tuple[str, dict[str | int, Any]]) -> None:
+            await callback(*value)
+
+        subscriber = self._dispatcher.subscribe(route, name=callback_name(callback))
+        keys = [None] if sites is None else list(sites)
+        for key in keys:
+            self._routes.setdefault(key, []).append(subscriber)
+
+        def remove_callback() -> None:
+            for key in keys:
+                routes = self._routes.get(key)
+                if routes is not None and subscriber in routes:
+                    routes.remove(subscriber)
+                    if not routes:
+                        del self._routes[key]
+            self._dispatcher.unsubscribe(subscriber)
+
+        return remove_callback
+
+    def _route(self, controller: NHCController, changes: dict[str | int, Any]) -> None:
+        """Route the changes of a frame to the callbacks of its site and those of all sites."""
+        site = self._sites[controller]
+        value = (site, changes)
+        for subscriber in self._routes.get(site, ()):
+            self._dispatcher.dispatch(subscriber, value)
+        for subscriber in self._routes.get(None, ()):
+            self._dispatcher.dispatch(subscriber, value)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Connection state, entity count and probe latency per site."""
+        return {
+            site: {
+                "connected": controller.connected,
+                "actions": len(controller.actions),
+                "thermostats": len(controller.thermostats),
+                "energy": len(controller.energy),
+                "latency": controller.latency["commands"]["latency"],
+            }
+            for site, controller in self._controllers.items()
+        }
@@ -0,0 +1,183 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+from .const import JOB_OVERFLOW_BLOCK, JOB_OVERFLOW_DROP_OLDEST, JOB_OVERFLOW_REJECT
+from .errors import ConnectionError, JobQueueFullError
+from .metrics import NHCMetrics
+
+Job = Callable[[], Awaitable[Any]]
+
+class _QueuedJob:
+    """A job waiting in the queue."""
+    __slots__ = ("job", "future", "key", "queued_at")
+
+    def __init__(self, job: Job, future: asyncio.Future, key: Hashable | None) -> None:
+        self.job = job
+        self.future = future
+        self.key = key
+        self.queued_at = 0.0
+
+class NHCJobQueue:
+    """
+    A queue that runs jobs one at a time on a single worker task.
+
+    With coalesce enabled, a job queued with a key replaces the job still waiting for that key (last write wins),
+    debounce holds keyed jobs back for that many seconds so a burst of updates collapses into one.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 0,
+        overflow: str = JOB_OVERFLOW_BLOCK,
+        coalesce: bool = False,
+        debounce: float = 0,
+    ) -> None:
+        if overflow not in (JOB_OVERFLOW_BLOCK, JOB_OVERFLOW_DROP_OLDEST, JOB_OVERFLOW_REJECT):
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self._max_size = max_size
+        self._overflow = overflow
+        self._coalesce = coalesce
+        self._debounce = debounce
+        self._jobs: deque[_QueuedJob] = deque()
+        self._waiting: dict[Hashable, _QueuedJob] = {}
+        self._delayed: dict[_QueuedJob, asyncio.TimerHandle] = {}
+        self._putters: deque[asyncio.Future] = deque()
+        # counts the closes, a put that waited for room across a close does not queue onto the reopened queue
+        self._closes = 0
+        self._worker: asyncio.Task | None = None
+        self.metrics: NHCMetrics | None = None
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def overflow(self) -> str:
+        return self._overflow
+
+    @property
+    def coalesce(self) -> bool:
+        return self._coalesce
+
+    @property
+    def debounce(self) -> float:
+        return self._debounce
+
+    def __len__(self) -> int:
+        return len(self._jobs) + len(self._delayed)
+
+    def _is_full(self) -> bool:
+        return self._max_size > 0 and len(self) >= self._max_size
+
+    async def put(self, job: Job, key: Hashable | None = None, replace: bool = True) -> asyncio.Future:
+        """
+        Queue a job, returns a future for the result of the job (or the job that replaced it).
+        Without replace a job waiting for the same key is kept and its future is returned, used for retries.
+        A put blocked on a full queue raises ConnectionError when the queue is closed.
+        """
+        if self._coalesce and key is not None and key in self._waiting:
+            queued = self._waiting[key]
+            if replace:
+                queued.job = job
+            return queued.future
+
+        if self._is_full():
+            if self._overflow == JOB_OVERFLOW_REJECT:
+                raise JobQueueFullError(self._max_size)
+            if self._overflow == JOB_OVERFLOW_DROP_OLDEST:
+                self._drop(self._jobs[0] if self._jobs else next(iter(self._delayed)))
+            else:
+                closes = self._closes
+                while self._is_full() and closes == self._closes:
+                    putter = asyncio.get_running_loop().create_future()
+                    self._putters.append(putter)
+                    try:
+                        await putter
+                    finally:
+                        if putter in self._putters:
+                            self._putters.remove(putter)
+                if closes != self._closes:
+                    raise ConnectionError("job queue closed")
+
+        queued = _QueuedJob(job, asyncio.get_running_loop().create_future(), key)
+        if self._coalesce and key is not None:
+            self._waiting[key] = queued
+            if self._debounce > 0:
+                self._delayed[queued] = asyncio.get_running_loop().call_later(
+                    self._debounce, self._enqueue, queued
+                )
+                return queued.future
+        self._enqueue(queued)
+        return queued.future
+
+    def _enqueue(self, queued: _QueuedJob) -> None:
+        """Move a job into the run queue and make sure the worker is running."""
+        self._delayed.pop(queued, None)
+        if self.metrics is not None:
+            queued.queued_at = time.monotonic()
+        self._jobs.append(queued)
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._work())
+
+    def _drop(self, queued: _QueuedJob) -> None:
+        """Drop a queued job, its waiters get a JobQueueFullError."""
+        if queued in self._delayed:
+            self._delayed.pop(queued).cancel()
+        else:
+            self._jobs.remove(queued)
+        if self._waiting.get(queued.key) is queued:
+            del self._waiting[queued.key]
+        if not queued.future.done():
+            queued.future.set_exception(JobQueueFullError(self._max_size))
+
+    async def _work(self) -> None:
+        """Run jobs until the queue is empty."""
+        try:
+            while self._jobs:
+                queued = self._jobs.popleft()
+                if self.metrics is not None:
+                    self.metrics.record_job(time.monotonic() - queued.queued_at, len(self))
+                if self._waiting.get(queued.key) is queued:
+                    del self._waiting[queued.key]
+                if self._putters:
+                    putter = self._putters.popleft()
+                    if not putter.done():
+                        putter.set_result(None)
+                if queued.future.done():
+                    continue
+                try:
+                    result = await queued.job()
+                except asyncio.CancelledError:
+                    queued.future.cancel()
+                    raise
+                except Exception as err:
+                    if not queued.future.done():
+                        queued.future.set_exception(err)
+                else:
+                    if not queued.future.done():
+                        queued.future.set_result(result)
+        finally:
+            self._worker = None
+
+    async def close(self) -> None:
+        """Stop the worker, cancel all queued jobs and fail the puts waiting for room."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        for queued, handle in self._delayed.items():
+            handle.cancel()
+            queued.future.cancel()
+        self._delayed.clear()
+        while self._jobs:
+            self._jobs.popleft().future.cancel()
+        self._waiting.clear()
+        self._closes += 1
+        while self._putters:
+            putter = self._putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
@@ -2,29 +2,43 @@ from typing import Optional
 from .action import NHCAction
 
 class NHCLight(NHCAction):
+    __slots__ = ()
 
     @property
     def is_on(self) -> bool:
         """Is on."""
         return self._state > 0
 
-    async def turn_on(self, brightness: Optional[int] = None) -> None:
-        """Turn On."""
+    def turn_on_value(self, brightness: Optional[int] = None) -> int:
+        """The value to execute to turn on."""
         if (brightness is None):
             if self.is_dimmable:
-                brightness = 254
-            else:
-                brightness = self._state if self._state > 0 else 100
-        else:
-            brightness = round(brightness / 2.55)
-        await self._controller.execute(self.id, brightness)
+                return 254
+            return self._state if self._state > 0 else 100
+        return round(brightness / 2.55)
+
+    def expected_state(self, value: int) -> Optional[int]:
+        """Dimmers turn off with 255, 254 restores the last brightness which is not known."""
+        if self.is_dimmable:
+            if value == 255:
+                return 0
+            if value == 254:
+                return None
+        return value
+
+    def turn_off_value(self) -> int:
+        """The value to execute to turn off."""
+        if self.is_dimmable:
+            return 255
+        return 0
+
+    async def turn_on(self, brightness: Optional[int] = None) -> None:
+        """Turn On."""
+        await self._controller.execute(self.id, self.turn_on_value(brightness))
 
     async def turn_off(self) -> None:
         """Turn off."""
-        value = 0
-        if self.is_dimmable:
-            value = 255
-        await self._controller.execute(self.id, value)
+        await self._controller.execute(self.id, self.turn_off_value())
 
     async def toggle(self) -> None:
         """Toggle on/off."""
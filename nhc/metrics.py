@@ -0,0 +1,139 @@
+import time
+from bisect import bisect_left
+from typing import Any
+
+class NHCHistogram:
+    """A histogram with fixed buckets, in seconds."""
+    __slots__ = ("counts", "count", "total", "max")
+
+    BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float) -> float:
+        """The upper bound of the bucket holding the percentile, max for the overflow bucket."""
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return self.BOUNDS[index] if index < len(self.BOUNDS) else self.max
+        return 0.0
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+class NHCMetricsHook:
+    """Receives every measurement as it happens, override the methods you need."""
+
+    def command(self, cmd: str | None, duration: float) -> None:
+        pass
+
+    def job(self, wait: float, depth: int) -> None:
+        pass
+
+    def event(self, event: str) -> None:
+        pass
+
+    def parse(self, duration: float) -> None:
+        pass
+
+    def callback(self, key: str, duration: float) -> None:
+        """key is the callback name and the id of the subscriber, as in NHCSubscriber.key."""
+
+class NHCMetrics:
+    """
+    Hot path measurements of a controller: command latency per command, job queue depth and wait time, events per
+    event type, parse time and callback duration per subscriber.
+    Without metrics the controller, connection, job queue and dispatcher skip all of this.
+    """
+
+    def __init__(self, hook: NHCMetricsHook | None = None) -> None:
+        self._hook = hook
+        self._started = time.monotonic()
+        self._last_snapshot = self._started
+        self._last_events: dict[str, int] = {}
+        self.commands: dict[str | None, NHCHistogram] = {}
+        self.job_wait = NHCHistogram()
+        self.job_depth = 0
+        self.max_job_depth = 0
+        self.events: dict[str, int] = {}
+        self.parse = NHCHistogram()
+        self.callbacks: dict[str, NHCHistogram] = {}
+
+    @property
+    def hook(self) -> NHCMetricsHook | None:
+        return self._hook
+
+    def record_command(self, cmd: str | None, duration: float) -> None:
+        histogram = self.commands.get(cmd)
+        if histogram is None:
+            histogram = self.commands[cmd] = NHCHistogram()
+        histogram.observe(duration)
+        if self._hook is not None:
+            self._hook.command(cmd, duration)
+
+    def record_job(self, wait: float, depth: int) -> None:
+        self.job_wait.observe(wait)
+        self.job_depth = depth
+        if depth > self.max_job_depth:
+            self.max_job_depth = depth
+        if self._hook is not None:
+            self._hook.job(wait, depth)
+
+    def record_event(self, event: str) -> None:
+        self.events[event] = self.events.get(event, 0) + 1
+        if self._hook is not None:
+            self._hook.event(event)
+
+    def record_parse(self, duration: float) -> None:
+        self.parse.observe(duration)
+        if self._hook is not None:
+            self._hook.parse(duration)
+
+    def record_callback(self, key: str, duration: float) -> None:
+        histogram = self.callbacks.get(key)
+        if histogram is None:
+            histogram = self.callbacks[key] = NHCHistogram()
+        histogram.observe(duration)
+        if self._hook is not None:
+            self._hook.callback(key, duration)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        A copy of all measurements, events per second are over the time since the previous snapshot.
+        """
+        now = time.monotonic()
+        elapsed = now - self._last_snapshot or 1e-9
+        events_per_second = {
+            event: (count - self._last_events.get(event, 0)) / elapsed for event, count in self.events.items()
+        }
+        self._last_snapshot = now
+        self._last_events = dict(self.events)
+        return {
+            "uptime": now - self._started,
+            "commands": {cmd: histogram.snapshot() for cmd, histogram in self.commands.items()},
+            "jobs": {"depth": self.job_depth, "max_depth": self.max_job_depth, "wait": self.job_wait.snapshot()},
+            "events": dict(self.events),
+            "events_per_second": events_per_second,
+            "parse": self.parse.snapshot(),
+            "callbacks": {key: histogram.snapshot() for key, histogram in self.callbacks.items()},
+        }
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections.abc import Callable, Hashable
+from typing import Any
+from .metrics import NHCHistogram
+
+class _PendingState:
+    __slots__ = ("entity", "previous", "expected", "started", "handle")
+
+    def __init__(self, entity, previous: Any) -> None:
+        self.entity = entity
+        self.previous = previous
+        self.expected: Any = None
+        self.started = 0.0
+        self.handle: asyncio.TimerHandle | None = None
+
+class NHCOptimistic:
+    """
+    Applies the expected state of a command the moment it is queued and marks the entity as pending.
+
+    The next event for the entity ends the pending state, it is confirmed when it reports the expected state and
+    corrected otherwise (the reported state wins). Without an event within timeout seconds, or when the command fails,
+    the entity rolls back to its previous state. Confirmation latency is recorded per entity.
+    """
+
+    def __init__(self, timeout: float = 5) -> None:
+        self.timeout = timeout
+        self._pending: dict[Hashable, _PendingState] = {}
+        self.latency: dict[Hashable, NHCHistogram] = {}
+        self.confirmed = 0
+        self.corrected = 0
+        self.rolled_back = 0
+        # set by the controller, called with the entity id and its event value after every optimistic change
+        self.on_change: Callable[[Hashable, Any], None] | None = None
+
+    def apply(self, entity, expected: Any) -> None:
+        """Apply the expected state, a second command before the first is confirmed keeps the original rollback state."""
+        pending = self._pending.get(entity.id)
+        if pending is None:
+            pending = self._pending[entity.id] = _PendingState(entity, entity.set_pending(expected))
+        else:
+            entity.set_pending(expected)
+            pending.handle.cancel()
+        pending.expected = expected
+        pending.started = time.perf_counter()
+        pending.handle = asyncio.get_running_loop().call_later(self.timeout, self.rollback, entity)
+        self._changed(entity)
+
+    def resolve(self, entity, value: Any) -> None:
+        """An event arrived for a pending entity, value is the event value (the event itself for thermostats)."""
+        pending = self._pending.pop(entity.id, None)
+        if pending is None:
+            return
+        pending.handle.cancel()
+        entity.confirm()
+        expected = pending.expected
+        if isinstance(expected, dict):
+            matched = all(value.get(key) == item for key, item in expected.items())
+        else:
+            matched = value == expected
+        if matched:
+            self.confirmed += 1
+            histogram = self.latency.get(entity.id)
+            if histogram is None:
+                histogram = self.latency[entity.id] = NHCHistogram()
+            histogram.observe(time.perf_counter() - pending.started)
+        else:
+            self.corrected += 1
+
+    def rollback(self, entity) -> None:
+        """Restore the state from before the pending commands."""
+        pending = self._pending.pop(entity.id, None)
+        if pending is None:
+            return
+        pending.handle.cancel()
+        entity.rollback(pending.previous)
+        self.rolled_back += 1
+        self._changed(entity)
+
+    def _changed(self, entity) -> None:
+        if self.on_change is not None:
+            self.on_change(entity.id, entity.event_value)
+
+    @property
+    def pending(self) -> list:
+        """The entities waiting for confirmation."""
+        return [pending.entity for pending in self._pending.values()]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "confirmed": self.confirmed,
+            "corrected": self.corrected,
+            "rolled_back": self.rolled_back,
+            "latency": {id: histogram.snapshot() for id, histogram in self.latency.items()},
+        }
+
+    def close(self) -> None:
+        """Roll back all pending entities without notifying, the controller resynchronises on the next connect."""
+        for pending in self._pending.values():
+            pending.handle.cancel()
+            pending.entity.rollback(pending.previous)
+        self._pending.clear()
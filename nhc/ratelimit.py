@@ -0,0 +1,72 @@
+import asyncio
+import random
+import time
+
+class NHCRateLimiter:
+    """
+    A token bucket pacing the commands sent to the controller.
+
+    Every accepted command raises the rate a little, every error 200 (ToManyRequestsOrSyntaxError) cuts it, so the rate
+    settles just below what the controller sustains. Throttled commands are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        rate: float = 20,
+        burst: int = 5,
+        min_rate: float = 1,
+        max_rate: float = 200,
+        increase: float = 0.2,
+        decrease: float = 0.5,
+        retries: int = 5,
+        backoff: float = 0.05,
+        max_backoff: float = 2,
+    ) -> None:
+        self._rate = rate
+        self._burst = burst
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._increase = increase
+        self._decrease = decrease
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._tokens: float = burst
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """The current rate in commands per second."""
+        return self._rate
+
+    @property
+    def retries(self) -> int:
+        """How many times a throttled command is retried."""
+        return self._retries
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a command may be sent."""
+        self._refill()
+        while self._tokens < 1:
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+            self._refill()
+        self._tokens -= 1
+
+    def success(self) -> None:
+        """A command was accepted, probe a slightly higher rate."""
+        self._rate = min(self._max_rate, self._rate + self._increase)
+
+    def throttled(self) -> None:
+        """The controller answered with error 200, slow down and drop the saved up burst."""
+        self._refill()
+        self._rate = max(self._min_rate, self._rate * self._decrease)
+        self._tokens = min(self._tokens, 0)
+
+    def backoff(self, attempt: int) -> float:
+        """The delay before retry attempt (0 based), with full jitter."""
+        return random.uniform(0, min(self._max_backoff, self._backoff * 2 ** attempt))
@@ -0,0 +1,82 @@
+import asyncio
+import mmap
+import struct
+import time
+from collections.abc import Iterator
+
+MAGIC = b"NHCREC1\n"
+# wall clock timestamp and frame length before every frame
+HEADER = struct.Struct("<dI")
+
+class NHCRecorder:
+    """
+    Appends every received frame with its timestamp to a log file, replay it with NHCReplayer.
+
+    Frames are written to a buffered file on the event loop, a write only reaches the disk when the buffer is full.
+    """
+
+    def __init__(self, path: str, buffering: int = 2 ** 16) -> None:
+        self._path = path
+        self._file = open(path, "ab", buffering=buffering)
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self.frames = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def record(self, frame: bytes) -> None:
+        self._file.write(HEADER.pack(time.time(), len(frame)))
+        self._file.write(frame)
+        self.frames += 1
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+class NHCReplayer:
+    """Reads a log written by NHCRecorder through a memory map and feeds its frames to a controller."""
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+
+    def frames(self) -> Iterator[tuple[float, bytes]]:
+        """All frames with their timestamps, a frame cut short by a crash while recording ends the log."""
+        with open(self._path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self._path} is not a recording")
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                offset = len(MAGIC)
+                size = len(log)
+                while offset + HEADER.size <= size:
+                    timestamp, length = HEADER.unpack_from(log, offset)
+                    offset += HEADER.size
+                    if offset + length > size:
+                        return
+                    yield timestamp, log[offset:offset + length]
+                    offset += length
+
+    async def replay(self, controller, speed: float | None = 1) -> int:
+        """
+        Feed the frames through the controller's parse and dispatch path, at speed times real time or as fast as
+        possible when speed is None. Returns the number of frames.
+        """
+        count = 0
+        first = None
+        start = time.monotonic()
+        for timestamp, frame in self.frames():
+            if speed is None:
+                # let the dispatcher run the callbacks, as it would between frames from the socket
+                await asyncio.sleep(0)
+            else:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp - first) / speed - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await controller.feed(frame)
+            count += 1
+        return count
@@ -0,0 +1,96 @@
+from collections.abc import Callable, Hashable, Iterable
+from .dispatch import NHCSubscriber
+
+class NHCRoute:
+    """A callback for a group of entities, filters are sets and None matches everything."""
+    __slots__ = ("subscriber", "types", "locations", "ids")
+
+    def __init__(
+        self,
+        subscriber: NHCSubscriber,
+        types: Iterable[str] | None = None,
+        locations: Iterable[str | None] | None = None,
+        ids: Iterable[Hashable] | None = None,
+    ) -> None:
+        self.subscriber = subscriber
+        self.types = None if types is None else frozenset(types)
+        self.locations = None if locations is None else frozenset(locations)
+        self.ids = None if ids is None else frozenset(ids)
+
+    def matches(self, type: str | None, id: Hashable, location: str | None) -> bool:
+        return (
+            (self.types is None or type in self.types)
+            and (self.locations is None or location in self.locations)
+            and (self.ids is None or id in self.ids)
+        )
+
+class NHCRoutingTable:
+    """
+    The callbacks of every entity id, compiled from the callbacks per id and the group callbacks.
+
+    The table is rebuilt on the first lookup after a callback or the topology changed, a lookup is a single dict get.
+    Ids outside the topology only reach their own callbacks and the group callbacks without a type or location filter.
+    """
+
+    def __init__(self, entities: Callable[[], Iterable[tuple[Hashable, str | None, str | None]]]) -> None:
+        # entities returns (id, type, location) for every known entity
+        self._entities = entities
+        self._callbacks: dict[Hashable, list[NHCSubscriber]] = {}
+        self._routes: list[NHCRoute] = []
+        self._table: dict[Hashable, tuple[tuple[NHCSubscriber, ...], tuple[NHCSubscriber, ...]]] | None = None
+        self._default: tuple[tuple[NHCSubscriber, ...], tuple[NHCSubscriber, ...]] = ((), ())
+
+    def add(self, id: Hashable, subscriber: NHCSubscriber) -> None:
+        self._callbacks.setdefault(id, []).append(subscriber)
+        self._table = None
+
+    def remove(self, id: Hashable, subscriber: NHCSubscriber) -> None:
+        self._callbacks[id].remove(subscriber)
+        if not self._callbacks[id]:
+            del self._callbacks[id]
+        self._table = None
+
+    def add_route(self, route: NHCRoute) -> None:
+        self._routes.append(route)
+        self._table = None
+
+    def remove_route(self, route: NHCRoute) -> None:
+        self._routes.remove(route)
+        self._table = None
+
+    def invalidate(self) -> None:
+        """The topology changed, rebuild on the next lookup."""
+        self._table = None
+
+    def _compile(self) -> dict[Hashable, tuple[tuple[NHCSubscriber, ...], tuple[NHCSubscriber, ...]]]:
+        known: dict[Hashable, tuple[str | None, str | None]] = {
+            id: (type, location) for id, type, location in self._entities()
+        }
+        ids = set(known).union(self._callbacks)
+        for route in self._routes:
+            if route.ids is not None:
+                ids.update(route.ids)
+        table = {}
+        for id in ids:
+            type, location = known.get(id, (None, None))
+            if id not in known:
+                routes = tuple(
+                    route.subscriber for route in self._routes
+                    if route.types is None and route.locations is None and (route.ids is None or id in route.ids)
+                )
+            else:
+                routes = tuple(route.subscriber for route in self._routes if route.matches(type, id, location))
+            table[id] = (tuple(self._callbacks.get(id, ())), routes)
+        self._default = ((), tuple(
+            route.subscriber for route in self._routes
+            if route.types is None and route.locations is None and route.ids is None
+        ))
+        self._table = table
+        return table
+
+    def lookup(self, id: Hashable) -> tuple[tuple[NHCSubscriber, ...], tuple[NHCSubscriber, ...]]:
+        """The callbacks of an id and the group callbacks matching it, the latter receive (id, value)."""
+        table = self._table
+        if table is None:
+            table = self._compile()
+        return table.get(id, self._default)
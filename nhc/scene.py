@@ -1,6 +1,11 @@
 from .action import NHCAction
 
 class NHCScene(NHCAction):
+    __slots__ = ()
+
+    def expected_state(self, value: int) -> None:
+        """A scene has no state of its own."""
+        return None
 
     async def activate(self) -> None:
         """Activate the scene."""
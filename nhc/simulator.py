@@ -0,0 +1,264 @@
+import asyncio
+import json
+import random
+import time
+from typing import Any
+from .const import DEFAULT_PORT, COVER_OPEN, COVER_CLOSE, COVER_STOP
+
+class NHCSimulator:
+    """
+    A local stand-in for a Niko Home Control controller, speaking the same json protocol.
+
+    It answers listactions, listlocations, listthermostat, listenergy, systeminfo, executeactions, executethermostat
+    and startevents, and pushes listactions, getlive, listthermostat and getalarms events to clients that started
+    events. Channel counts, the event rate and the latency added before every response are configurable,
+    max_rate makes it answer error 200 when more commands per second are executed.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        actions: int = 20,
+        locations: int = 4,
+        thermostats: int = 2,
+        energy: int = 2,
+        event_rate: float = 0,
+        latency: float = 0,
+        max_rate: float = 0,
+    ) -> None:
+        self._host = host
+        self._port = port
+        self._event_rate = event_rate
+        self._latency = latency
+        self._max_rate = max_rate
+        self._server: asyncio.Server | None = None
+        self._event_task: asyncio.Task | None = None
+        self._clients: set[asyncio.StreamWriter] = set()
+        self._subscribers: set[asyncio.StreamWriter] = set()
+        self._executed: list[float] = []
+        self.locations = [{"id": i, "name": f"location {i}"} for i in range(locations)]
+        self.actions = [
+            {"id": i, "name": f"action {i}", "type": (0, 1, 2, 3, 4)[i % 5], "location": i % max(locations, 1), "value1": 0}
+            for i in range(actions)
+        ]
+        self.thermostats = [
+            {
+                "id": i,
+                "name": f"thermostat {i}",
+                "location": i % max(locations, 1),
+                "mode": 0,
+                "setpoint": 200,
+                "measured": 195,
+                "overrule": 0,
+                "overruletime": "00:00",
+                "ecosave": 0,
+            }
+            for i in range(thermostats)
+        ]
+        self.energy = [{"channel": i, "name": f"energy {i}", "type": i % 3, "v": 0} for i in range(energy)]
+        self.systeminfo = {"swversion": "simulator", "api": "2.0", "lastconfig": "20240101000000"}
+
+    @property
+    def host(self) -> str:
+        return self._host
+
+    @property
+    def port(self) -> int:
+        """The port, the bound port when started with port 0."""
+        if self._server is not None and self._server.sockets:
+            return self._server.sockets[0].getsockname()[1]
+        return self._port
+
+    @property
+    def subscribers(self) -> int:
+        """The number of clients that started events."""
+        return len(self._subscribers)
+
+    async def wait_subscribed(self, count: int = 1) -> None:
+        """Wait until count clients started events."""
+        while len(self._subscribers) < count:
+            await asyncio.sleep(0.001)
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_client, self._host, self._port)
+        if self._event_rate > 0:
+            self._event_task = asyncio.create_task(self._push_events())
+
+    async def stop(self) -> None:
+        if self._event_task is not None:
+            self._event_task.cancel()
+            self._event_task = None
+        for writer in list(self._clients):
+            writer.close()
+        self._clients.clear()
+        self._subscribers.clear()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> "NHCSimulator":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.stop()
+
+    def _throttled(self) -> bool:
+        if not self._max_rate:
+            return False
+        now = time.monotonic()
+        self._executed = [executed for executed in self._executed if executed > now - 1]
+        if len(self._executed) >= self._max_rate:
+            return True
+        self._executed.append(now)
+        return False
+
+    @staticmethod
+    def _reported_value(action: dict[str, Any], value: int) -> int:
+        """The value1 the controller reports for an executed value, dimmers and covers take special values."""
+        if action["type"] == 2:
+            if value == 255:
+                return 0
+            if value == 254:
+                return action["value1"] or 100
+        if action["type"] in (4, 5):
+            if value == COVER_OPEN:
+                return 100
+            if value == COVER_CLOSE:
+                return 0
+            if value == COVER_STOP:
+                return action["value1"]
+        return value
+
+    def _handle_command(self, command: dict[str, Any]) -> tuple[Any, dict[str, Any] | None]:
+        """Returns the response data and the event to push, if any."""
+        cmd = command.get("cmd")
+        if cmd == "listactions":
+            return self.actions, None
+        if cmd == "listlocations":
+            return self.locations, None
+        if cmd == "listthermostat":
+            return self.thermostats, None
+        if cmd == "listenergy":
+            return self.energy, None
+        if cmd == "systeminfo":
+            return self.systeminfo, None
+        if cmd == "startevents":
+            return {"error": 0}, None
+        if cmd == "executeactions":
+            if self._throttled():
+                return {"error": 200}, None
+            for action in self.actions:
+                if action["id"] == command["id"]:
+                    action["value1"] = self._reported_value(action, command["value1"])
+                    return {"error": 0}, {"event": "listactions", "data": [{"id": action["id"], "value1": action["value1"]}]}
+            return {"error": 100}, None
+        if cmd == "executethermostat":
+            if self._throttled():
+                return {"error": 200}, None
+            for thermostat in self.thermostats:
+                if thermostat["id"] == command["id"]:
+                    if "mode" in command:
+                        thermostat["mode"] = command["mode"]
+                    if "overrule" in command:
+                        thermostat["overrule"] = command["overrule"]
+                        thermostat["overruletime"] = command.get("overruletime", thermostat["overruletime"])
+                    return {"error": 0}, {"event": "listthermostat", "data": [dict(thermostat)]}
+            return {"error": 100}, None
+        return {"error": 200}, None
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Commands are not newline delimited, they are decoded one json object at a time."""
+        self._clients.add(writer)
+        decoder = json.JSONDecoder()
+        buffer = ""
+        try:
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                # the controller accepts a trailing comma in an object
+                buffer += chunk.decode().replace(",}", "}")
+                while True:
+                    buffer = buffer.lstrip()
+                    if not buffer:
+                        break
+                    try:
+                        command, end = decoder.raw_decode(buffer)
+                    except ValueError:
+                        break
+                    buffer = buffer[end:]
+                    if self._latency:
+                        await asyncio.sleep(self._latency)
+                    data, event = self._handle_command(command)
+                    writer.write(self._encode({"cmd": command.get("cmd"), "data": data}))
+                    if command.get("cmd") == "startevents":
+                        self._subscribers.add(writer)
+                    if event is not None:
+                        self.push(event)
+                await writer.drain()
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            self._subscribers.discard(writer)
+            writer.close()
+
+    def _encode(self, message: dict[str, Any]) -> bytes:
+        return (json.dumps(message, separators=(",", ":")) + "\r\n").encode()
+
+    def push(self, event: dict[str, Any]) -> None:
+        """Push an event to all clients that started events."""
+        line = self._encode(event)
+        for writer in list(self._subscribers):
+            if writer.is_closing():
+                self._subscribers.discard(writer)
+            else:
+                writer.write(line)
+
+    def random_event(self) -> dict[str, Any]:
+        """A random listactions, getlive, listthermostat or getalarms event."""
+        kind = random.random()
+        if kind < 0.5 and self.energy:
+            channel = random.choice(self.energy)
+            channel["v"] = random.randint(0, 5000)
+            return {"event": "getlive", "data": {"channel": channel["channel"], "v": channel["v"]}}
+        if kind < 0.6 and self.thermostats:
+            thermostat = random.choice(self.thermostats)
+            thermostat["measured"] = random.randint(150, 250)
+            return {"event": "listthermostat", "data": [dict(thermostat)]}
+        if kind < 0.62:
+            return {"event": "getalarms", "data": {"id": random.randint(0, 10), "type": random.randint(0, 1), "text": "alarm"}}
+        action = random.choice(self.actions)
+        action["value1"] = random.randint(0, 100)
+        return {"event": "listactions", "data": [{"id": action["id"], "value1": action["value1"]}]}
+
+    async def burst(self, count: int) -> None:
+        """Push count random events as fast as the subscribers read them."""
+        for index in range(count):
+            self.push(self.random_event())
+            if index % 100 == 99:
+                await self.drain()
+        await self.drain()
+
+    async def drain(self) -> None:
+        for writer in list(self._subscribers):
+            try:
+                await writer.drain()
+            except (ConnectionError, OSError):
+                self._subscribers.discard(writer)
+
+    async def _push_events(self) -> None:
+        """Push random events at event_rate per second."""
+        interval = 1 / self._event_rate
+        next_event = time.monotonic()
+        while True:
+            self.push(self.random_event())
+            next_event += interval
+            delay = next_event - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                await self.drain()
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import threading
+from typing import Any
+
+# systeminfo fields that change when the installation is reprogrammed or the controller updated
+SNAPSHOT_KEYS = ("lastconfig", "swversion")
+# saves run in threads, controllers sharing a file (with one or more NHCSnapshot) must not interleave their read and
+# replace, saves are rare so one lock serves all files
+_SAVE_LOCK = threading.Lock()
+
+class NHCSnapshot:
+    """
+    The discovered topology and last known states of controllers, stored as a json file keyed by host.
+    Each entry keeps the systeminfo of the controller it was taken from next to the discovery payloads, a snapshot is
+    only used while that systeminfo still matches the controller.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            with open(self._path, encoding="utf-8") as file:
+                snapshots = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        return snapshots if isinstance(snapshots, dict) else {}
+
+    def load(self, host: str, systeminfo: dict[str, Any]) -> dict[str, Any] | None:
+        """
+        Load the snapshot of a host, None when there is none or when it was taken before the configuration or software
+        of the controller changed (systeminfo is the current one).
+        """
+        snapshot = self._read().get(host)
+        if not isinstance(snapshot, dict) or not isinstance(snapshot.get("systeminfo"), dict):
+            return None
+        if any(snapshot["systeminfo"].get(key) != systeminfo.get(key) for key in SNAPSHOT_KEYS):
+            return None
+        return snapshot
+
+    def save(self, host: str, snapshot: dict[str, Any]) -> None:
+        """Save the snapshot of a host, the file is replaced atomically."""
+        with _SAVE_LOCK:
+            snapshots = self._read()
+            snapshots[host] = snapshot
+            descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(self._path) or ".", suffix=".tmp")
+            try:
+                with open(descriptor, "w", encoding="utf-8") as file:
+                    json.dump(snapshots, file, separators=(",", ":"))
+                os.replace(temp_path, self._path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
@@ -0,0 +1,150 @@
+import asyncio
+from collections import OrderedDict, deque
+from collections.abc import Callable, Hashable, Iterable
+from typing import Any
+from .const import EVENT_POLICY_BLOCK, EVENT_POLICY_COALESCE, EVENT_POLICY_DROP_NEWEST, EVENT_POLICY_DROP_OLDEST
+
+class NHCEventSubscription:
+    """
+    An async iterator over the events of a controller, created with NHCController.events.
+
+    Every subscription has its own bounded queue, when it is full the policy decides: drop_oldest and drop_newest drop
+    an event, coalesce keeps only the latest event per id (dropping the oldest when a new id does not fit) and block
+    makes the listener of the event connection wait, which pushes back on it (only with dual_connection, the commands
+    have their own connection then).
+
+    Filters are sets, None matches everything: kinds ("action", "energy", "thermostat", "alarm"), types ("lights",
+    "covers", "fans", "scenes", "thermostats", "energy"), ids (entity ids) and locations (suggested areas).
+    """
+
+    def __init__(
+        self,
+        kinds: Iterable[str] | None = None,
+        types: Iterable[str] | None = None,
+        ids: Iterable[Hashable] | None = None,
+        locations: Iterable[str] | None = None,
+        max_size: int = 100,
+        policy: str = EVENT_POLICY_DROP_OLDEST,
+        always: bool = False,
+        on_close: Callable[["NHCEventSubscription"], None] | None = None,
+    ) -> None:
+        if policy not in (EVENT_POLICY_DROP_OLDEST, EVENT_POLICY_DROP_NEWEST, EVENT_POLICY_COALESCE, EVENT_POLICY_BLOCK):
+            raise ValueError(f"unknown policy: {policy}")
+        self.kinds = None if kinds is None else frozenset(kinds)
+        self.types = None if types is None else frozenset(types)
+        self.ids = None if ids is None else frozenset(ids)
+        self.locations = None if locations is None else frozenset(locations)
+        self.always = always
+        self._max_size = max_size
+        self._policy = policy
+        self._on_close = on_close
+        self._events: OrderedDict[Hashable, Any] | deque[Any] = (
+            OrderedDict() if policy == EVENT_POLICY_COALESCE else deque()
+        )
+        self._getter: asyncio.Future | None = None
+        self._putters: deque[asyncio.Future] = deque()
+        self._closed = False
+        self._unkeyed = 0
+        self.dropped = 0
+
+    @property
+    def policy(self) -> str:
+        return self._policy
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def matches(self, kind: str, type: str | None, id: Hashable | None, location: str | None) -> bool:
+        return (
+            (self.kinds is None or kind in self.kinds)
+            and (self.types is None or type in self.types)
+            and (self.ids is None or id in self.ids)
+            and (self.locations is None or location in self.locations)
+        )
+
+    async def put(self, id: Hashable | None, event: Any) -> None:
+        """Queue an event, only blocks with the block policy."""
+        if self._closed:
+            return
+        if self._policy == EVENT_POLICY_COALESCE:
+            if id is None:
+                # events without an id (alarms) are never coalesced
+                id = self._unkeyed = self._unkeyed - 1
+            if id in self._events:
+                self._events[id] = event
+                return
+        if len(self._events) >= self._max_size:
+            if self._policy == EVENT_POLICY_DROP_NEWEST:
+                self.dropped += 1
+                return
+            if self._policy == EVENT_POLICY_BLOCK:
+                while len(self._events) >= self._max_size and not self._closed:
+                    putter = asyncio.get_running_loop().create_future()
+                    self._putters.append(putter)
+                    try:
+                        await putter
+                    finally:
+                        if putter in self._putters:
+                            self._putters.remove(putter)
+                if self._closed:
+                    return
+            else:
+                self._pop()
+                self.dropped += 1
+        if self._policy == EVENT_POLICY_COALESCE:
+            self._events[id] = event
+        else:
+            self._events.append(event)
+        if self._getter is not None and not self._getter.done():
+            self._getter.set_result(None)
+
+    def _pop(self) -> Any:
+        if self._policy == EVENT_POLICY_COALESCE:
+            return self._events.popitem(last=False)[1]
+        return self._events.popleft()
+
+    async def get(self) -> Any:
+        """Wait for the next event, raises StopAsyncIteration once closed and empty."""
+        while not self._events:
+            if self._closed:
+                raise StopAsyncIteration
+            self._getter = asyncio.get_running_loop().create_future()
+            try:
+                await self._getter
+            finally:
+                self._getter = None
+        event = self._pop()
+        if self._putters:
+            putter = self._putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
+        return event
+
+    def close(self) -> None:
+        """Stop the subscription, events already queued can still be read."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._getter is not None and not self._getter.done():
+            self._getter.set_result(None)
+        for putter in self._putters:
+            if not putter.done():
+                putter.set_result(None)
+        if self._on_close is not None:
+            self._on_close(self)
+
+    def __aiter__(self) -> "NHCEventSubscription":
+        return self
+
+    async def __anext__(self) -> Any:
+        return await self.get()
+
+    async def __aenter__(self) -> "NHCEventSubscription":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.close()
@@ -1,6 +1,8 @@
 from .action import NHCBaseAction
 
 class NHCThermostat(NHCBaseAction):
+    __slots__ = ("_measured", "_setpoint", "_overrule", "_overruletime", "_ecosave")
+
     def __init__(self, controller, data):
         super().__init__(controller, data)
         self._measured = data["measured"] / 10
@@ -41,17 +43,50 @@ class NHCThermostat(NHCBaseAction):
     def ecosave(self):
         return self._ecosave
     
+    @property
+    def event_value(self) -> dict:
+        """The state in the shape of a thermostat event, as passed to the callbacks."""
+        return {
+            "id": self._id,
+            "mode": self._state,
+            "setpoint": round(self._setpoint * 10),
+            "measured": round(self._measured * 10),
+            "overrule": self._overrule,
+            "overruletime": self._overruletime,
+            "ecosave": self._ecosave,
+        }
+
     async def set_mode(self, mode):
         await self._controller.execute_thermostat_mode(self._id, mode, self._overruletime, self._overrule)
 
     async def set_temperature(self, setpoint):
         await self._controller.execute_thermostat_set_temperature(self._id, setpoint * 10)
     
-    def update_state(self, data):
+    def update_state(self, data) -> bool:
+        """Update state, returns True when it changed."""
+        previous = (self._state, self._setpoint, self._measured, self._overrule, self._overruletime, self._ecosave)
         self._state = data["mode"]
         self._setpoint = data["setpoint"] / 10
         self._measured = data["measured"] / 10
         self._overrule = data["overrule"]
         self._overruletime = data["overruletime"]
         self._ecosave = data["ecosave"]
+        return previous != (self._state, self._setpoint, self._measured, self._overrule, self._overruletime, self._ecosave)
+
+    def set_pending(self, expected):
+        """
+        Apply an expected mode and/or overrule ahead of its confirmation. set_temperature overrules the setpoint, the
+        controller reports the temperature (in tenths) in overrule and keeps the setpoint of the program.
+        """
+        previous = (self._state, self._overrule, self._overruletime)
+        if "mode" in expected:
+            self._state = expected["mode"]
+        if "overrule" in expected:
+            self._overrule = expected["overrule"]
+            self._overruletime = expected["overruletime"]
+        self._pending = True
+        return previous
 
+    def rollback(self, previous) -> None:
+        self._state, self._overrule, self._overruletime = previous
+        self._pending = False
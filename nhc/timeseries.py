@@ -0,0 +1,97 @@
+import operator
+import time
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterable
+from .const import ENERGY_TYPES
+
+class NHCEnergyBuffer:
+    """
+    A fixed size ring buffer of (timestamp, value) samples of an energy channel, backed by two arrays of doubles.
+    Memory stays the same no matter how many samples are appended, the oldest ones are overwritten.
+    Windows are in seconds back from the newest sample, None means everything in the buffer.
+    """
+    __slots__ = ("_capacity", "_times", "_values", "_next", "_count")
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2")
+        self._capacity = capacity
+        self._times = array("d", bytes(8 * capacity))
+        self._values = array("d", bytes(8 * capacity))
+        self._next = 0
+        self._count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, value: float, timestamp: float | None = None) -> None:
+        self._times[self._next] = time.time() if timestamp is None else timestamp
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self._capacity
+        if self._count < self._capacity:
+            self._count += 1
+
+    def window(self, seconds: float | None = None) -> tuple[array, array]:
+        """The timestamps and values in the window, oldest first."""
+        if self._count < self._capacity:
+            times, values = self._times[:self._count], self._values[:self._count]
+        else:
+            times = self._times[self._next:] + self._times[:self._next]
+            values = self._values[self._next:] + self._values[:self._next]
+        if seconds is not None and times:
+            start = bisect_left(times, times[-1] - seconds)
+            times, values = times[start:], values[start:]
+        return times, values
+
+    def mean(self, seconds: float | None = None) -> float | None:
+        _, values = self.window(seconds)
+        return sum(values) / len(values) if values else None
+
+    def min(self, seconds: float | None = None) -> float | None:
+        _, values = self.window(seconds)
+        return min(values) if values else None
+
+    def max(self, seconds: float | None = None) -> float | None:
+        _, values = self.window(seconds)
+        return max(values) if values else None
+
+    def peaks(self, seconds: float | None = None, threshold: float = 0) -> list[tuple[float, float]]:
+        """The (timestamp, value) of every local maximum at or above threshold."""
+        times, values = self.window(seconds)
+        return [
+            (times[index], values[index])
+            for index in range(1, len(values) - 1)
+            if values[index] >= threshold and values[index - 1] < values[index] >= values[index + 1]
+        ]
+
+    def energy(self, seconds: float | None = None) -> float:
+        """The energy in kWh over the window, integrating the power (W) samples with the trapezoidal rule."""
+        times, values = self.window(seconds)
+        if len(values) < 2:
+            return 0.0
+        intervals = map(operator.sub, times[1:], times[:-1])
+        sums = map(operator.add, values[1:], values[:-1])
+        return sum(map(operator.mul, intervals, sums)) / 2 / 3_600_000
+
+def aggregate_energy(channels: Iterable, seconds: float | None = None) -> dict[str, dict[str, float]]:
+    """
+    Mean power (W) and energy (kWh) per energy type (ENERGY_TYPES) over the window for channels with a history,
+    net is import minus export, sub_usage is already part of import and left out of it.
+    """
+    totals = {name: {"power": 0.0, "energy": 0.0} for name in ENERGY_TYPES.values()}
+    for channel in channels:
+        history = channel.history
+        name = ENERGY_TYPES.get(channel.type)
+        if history is None or name is None:
+            continue
+        totals[name]["power"] += history.mean(seconds) or 0.0
+        totals[name]["energy"] += history.energy(seconds)
+    totals["net"] = {
+        key: totals["import"][key] - totals["export"][key] for key in ("power", "energy")
+    }
+    return totals